@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import platform
+import sys
+
+# the benchmarks never show anything, so they can run without a display or sound card
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import configs
+import src.colors as colors
+import src.sprites as sprites
+
+import bench.harness as harness
+import bench.cases as cases
+
+
+def _compare(results, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)["results"]
+    print(f"\ncompared to {baseline_path}:")
+    for name, res in results.items():
+        if name in baseline:
+            speedup = baseline[name]["us_per_op"] / res["us_per_op"] if res["us_per_op"] > 0 else float('inf')
+            print(f"{name:<72} {speedup:>8.2f}x faster, "
+                  f"{res['alloc_bytes'] - baseline[name]['alloc_bytes']:>+10.0f} B allocated")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Runs the microbenchmarks.")
+    parser.add_argument("-k", "--filter", default=None, help="only run benchmarks whose names contain this")
+    parser.add_argument("-o", "--out", default=None, help="where to write the results (json)")
+    parser.add_argument("-c", "--compare", default=None, help="results (json) from an earlier run to compare to")
+    parser.add_argument("-t", "--min-time", type=float, default=0.25, help="seconds to spend on each benchmark")
+    parser.add_argument("--colorblind", dest="colorblind", action="store_true",
+                        help="use the colorblind palette (default: the game's, see configs.COLORBLIND_MODE)")
+    parser.add_argument("--no-colorblind", dest="colorblind", action="store_false",
+                        help="use the regular palette")
+    parser.set_defaults(colorblind=configs.COLORBLIND_MODE)
+    opts = parser.parse_args(args)
+
+    pygame.init()
+    screen = pygame.display.set_mode(cases.SCREEN_SIZE)
+    colors.load(colorblind=opts.colorblind)
+    sprites.load()
+
+    results = {}
+    for b in cases.all_benchmarks(screen):
+        if opts.filter is None or opts.filter in b.name:
+            res = harness.run(b, min_time=opts.min_time)
+            print(res)
+            results[b.name] = res.to_json()
+
+    blob = {
+        "commit": harness.get_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "colorblind": opts.colorblind,
+        "results": results
+    }
+    if opts.out is not None:
+        with open(opts.out, 'w') as f:
+            json.dump(blob, f, indent=2)
+        print(f"INFO: wrote benchmark results to {opts.out}")
+    if opts.compare is not None:
+        _compare(results, opts.compare)
+    return blob
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import json
+import os
+import random
+
+import pygame
+
+import src.level as level
+import src.loader as loader
+import src.sprites as sprites
+import src.inputs as inputs
+import src.rendering as rendering
+import src.transitions as transitions
+import src.utils as utils
+
+from bench.harness import Benchmark
+
+
+DIRECTIONS = ((0, -1), (-1, 0), (0, 1), (1, 0), (0, 0))
+
+# sizes of the randomly generated boards (from loader.make_demo_state2)
+DEMO_DIMS = ((13, 7), (40, 20), (100, 50))
+SCREEN_SIZE = (640, 480)
+
+
+def load_inputs(seed=12345):
+    """returns: list of (name, level json or None, state) for the shipped levels and some generated boards."""
+    res = []
+    base_path = utils.asset_path("assets/levels")
+    for fname in sorted(os.listdir(base_path)):
+        if fname.endswith(".json"):
+            with open(os.path.join(base_path, fname), 'r') as f:
+                blob = json.load(f)
+            res.append((fname[:-5], blob, level.from_json(blob)))
+
+    random.seed(seed)
+    for dims in DEMO_DIMS:
+        state = loader.make_demo_state2(dims=dims)
+        res.append((f"demo_{dims[0]}x{dims[1]}", None, state))
+    return res
+
+
+def _cycle(items):
+    i = 0
+    while True:
+        yield items[i % len(items)]
+        i += 1
+
+
+def simulation_benchmarks(name, blob, state):
+    moves = _cycle(DIRECTIONS)
+    yield Benchmark(f"State.get_next/{name}", lambda: state.get_next(next(moves)))
+
+    cache = transitions.TransitionCache()
+    cached_moves = _cycle(DIRECTIONS)
+    yield Benchmark(f"TransitionCache.get_next/{name}", lambda: cache.get_next(state, next(cached_moves)))
+    yield Benchmark(f"State.copy/{name}", state.copy)
+    if blob is not None:
+        yield Benchmark(f"level.from_json/{name}", lambda: level.from_json(blob))
+
+
+def sprite_benchmarks():
+    keys = _cycle([(ent_id, 48, color_id, (1, 1), 0)
+                   for ent_id in (sprites.EntityID.PLAYER, sprites.EntityID.WALL, sprites.EntityID.BOX)
+                   for color_id in range(0, 7)])
+    yield Benchmark("sprites._get_sprite/cold", lambda: sprites._get_sprite(next(keys)), setup=sprites.clear_cache)
+
+    sprites.clear_cache()
+    for _ in range(21):
+        sprites._get_sprite(next(keys))
+    yield Benchmark("sprites._get_sprite/warm", lambda: sprites._get_sprite(next(keys)))
+
+
+def rendering_benchmarks(name, state, screen):
+    next_state = state.get_next((0, 0))
+
+    renderer = rendering.AnimatedLevelRenderer(next_state, cell_size=48)
+
+    def _mid_transition():
+        renderer.set_state(next_state, prev=state)
+        renderer.prev_state_time = inputs.get_time() - renderer.trans_time / 2
+
+    def _no_transition():
+        renderer.set_state(next_state, prev=None)
+
+    yield Benchmark(f"AnimatedLevelRenderer.all_sorted_entities_to_render/idle/{name}",
+                    lambda: list(renderer.all_sorted_entities_to_render()), setup=_no_transition)
+    yield Benchmark(f"AnimatedLevelRenderer.all_sorted_entities_to_render/moving/{name}",
+                    lambda: list(renderer.all_sorted_entities_to_render()), setup=_mid_transition)
+
+    static_renderer = rendering.LevelRenderer(state, cell_size=48)
+    static_renderer.get_offset_for_centering(screen, and_apply=True)
+    static_renderer.draw(screen)  # warm up the sprite cache
+    yield Benchmark(f"LevelRenderer.draw/{name}", lambda: static_renderer.draw(screen))
+
+
+def all_benchmarks(screen: pygame.Surface):
+    inputs_ = load_inputs()
+    for name, blob, state in inputs_:
+        yield from simulation_benchmarks(name, blob, state)
+    yield from sprite_benchmarks()
+    for name, _, state in inputs_:
+        yield from rendering_benchmarks(name, state, screen)
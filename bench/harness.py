@@ -0,0 +1,92 @@
+import gc
+import subprocess
+import sys
+import time
+import tracemalloc
+import typing
+
+
+class Benchmark:
+
+    def __init__(self, name, op: typing.Callable[[], typing.Any], setup=None):
+        self.name = name
+        self.op = op
+        self.setup = setup  # called before every op (and not timed), if not None
+
+
+class BenchResult:
+
+    def __init__(self, name, n_ops, elapsed_time, alloc_blocks, alloc_bytes):
+        self.name = name
+        self.n_ops = n_ops
+        self.elapsed_time = elapsed_time
+        self.alloc_blocks = alloc_blocks  # memory blocks still allocated after an op (on average)
+        self.alloc_bytes = alloc_bytes  # peak bytes allocated during an op (on average)
+
+    def us_per_op(self) -> float:
+        return 1e6 * self.elapsed_time / max(1, self.n_ops)
+
+    def ops_per_sec(self) -> float:
+        return self.n_ops / self.elapsed_time if self.elapsed_time > 0 else float('inf')
+
+    def to_json(self) -> dict:
+        return {
+            "n_ops": self.n_ops,
+            "elapsed_time": self.elapsed_time,
+            "us_per_op": self.us_per_op(),
+            "ops_per_sec": self.ops_per_sec(),
+            "alloc_blocks": self.alloc_blocks,
+            "alloc_bytes": self.alloc_bytes
+        }
+
+    def __repr__(self):
+        return (f"{self.name:<72} {self.us_per_op():>12.2f} us/op {self.ops_per_sec():>12.1f} op/s "
+                f"{self.alloc_blocks:>8.1f} blocks {self.alloc_bytes:>10.0f} B")
+
+
+def run(bench: Benchmark, min_time=0.25, alloc_samples=20) -> BenchResult:
+    """Times an op (repeating it for at least min_time seconds), then measures its allocations separately."""
+    op = bench.op
+    setup = bench.setup
+
+    gc.collect()
+    n_ops = 0
+    elapsed = 0
+    batch = 1
+    while elapsed < min_time:
+        for _ in range(batch):
+            if setup is not None:
+                setup()
+            start_time = time.perf_counter()
+            op()
+            elapsed += time.perf_counter() - start_time
+        n_ops += batch
+        batch *= 2
+
+    # allocations are measured separately since tracemalloc slows everything down
+    results = []
+    gc.collect()
+    tracemalloc.start()
+    try:
+        total_bytes = 0
+        start_blocks = sys.getallocatedblocks()
+        for _ in range(alloc_samples):
+            if setup is not None:
+                setup()
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            results.append(op())  # keep the results alive, so they count as allocated
+            total_bytes += tracemalloc.get_traced_memory()[1] - start_bytes
+        alloc_blocks = (sys.getallocatedblocks() - start_blocks) / alloc_samples
+    finally:
+        tracemalloc.stop()
+
+    return BenchResult(bench.name, n_ops, elapsed, alloc_blocks, total_bytes / alloc_samples)
+
+
+def get_commit() -> typing.Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
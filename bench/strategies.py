@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import platform
+import sys
+
+import src.level as level
+import src.solver as solver
+import src.solutions as solutions
+import src.utils as utils
+
+import bench.harness as harness
+
+
+# name -> search options (see solver.make_solver)
+STRATEGIES = {
+    "bfs": {"mode": "bfs"},
+    "astar": {"mode": "astar", "heuristic": "combined"},
+    "astar-w2": {"mode": "astar", "heuristic": "combined", "weight": 2.0},
+    "astar-w5-enemies": {"mode": "astar", "heuristic": "enemies", "weight": 5.0},
+    "ida": {"mode": "ida", "heuristic": "combined"},
+    "beam": {"mode": "beam", "heuristic": "progress", "beam_width": 2000},
+    "beam-500-combined": {"mode": "beam", "heuristic": "combined", "beam_width": 500},
+    "auto": {"mode": "auto"},
+}
+
+
+def load_levels() -> list:
+    """returns: list of (name, state) for the shipped levels."""
+    res = []
+    base_path = utils.asset_path("assets/levels")
+    for fname in sorted(os.listdir(base_path)):
+        if fname.endswith(".json"):
+            with open(os.path.join(base_path, fname), 'r') as f:
+                res.append((fname[:-5], level.from_json(json.load(f))))
+    return res
+
+
+def run_strategy(state: level.State, options: dict, max_states, max_expanded, time_limit) -> dict:
+    res = solver.solve(state, max_states=max_states, time_limit=time_limit, measure_memory=False,
+                       max_expanded=max_expanded, **options)
+    return {
+        "steps": res.num_steps(),
+        "complete": res.complete,
+        "optimal": res.optimal,
+        "nodes_expanded": res.nodes_expanded,
+        "states_seen": res.states_seen,
+        "elapsed_time": res.elapsed_time
+    }
+
+
+def _quality(steps, par) -> str:
+    """returns: how much longer the solution is than the optimal one (if it's known)."""
+    if steps < 0:
+        return "-"
+    return "?" if par is None else f"{steps / max(1, par):.2f}x"
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.strategies",
+                                     description="Compares the solver's search strategies on the shipped levels.")
+    parser.add_argument("levels", nargs="*", help="only run these levels (by file name, without .json)")
+    parser.add_argument("-s", "--strategies", nargs="*", default=list(STRATEGIES), choices=list(STRATEGIES),
+                        help="strategies to compare")
+    parser.add_argument("-o", "--out", default=None, help="where to write the results (json)")
+    parser.add_argument("-n", "--max-states", type=int, default=500000, help="memory budget for each search")
+    parser.add_argument("--max-expanded", type=int, default=2000000, help="node budget for each search")
+    parser.add_argument("-t", "--time-limit", type=float, default=60, help="seconds to spend on each search")
+    opts = parser.parse_args(args)
+
+    cache = solutions.SolutionCache(utils.asset_path(solutions.CACHE_PATH))
+
+    print(f"{'level':<16} {'strategy':<20} {'steps':>6} {'par':>5} {'quality':>8} {'expanded':>10} "
+          f"{'seen':>10} {'time':>9}")
+    results = {}
+    for name, state in load_levels():
+        if len(opts.levels) > 0 and name not in opts.levels:
+            continue
+        entry = cache.get(solutions.level_key(state))
+        # (best-known solutions for levels that are too hard to solve optimally aren't a fair baseline)
+        par = None if entry is None or entry["steps"] < 0 or not entry.get("optimal", True) else entry["steps"]
+        results[name] = {"par": par, "strategies": {}}
+        for strategy in opts.strategies:
+            res = run_strategy(state, STRATEGIES[strategy], opts.max_states, opts.max_expanded, opts.time_limit)
+            results[name]["strategies"][strategy] = res
+            steps = str(res["steps"]) if res["steps"] >= 0 else ("none" if res["complete"] else "gave up")
+            print(f"{name:<16} {strategy:<20} {steps:>6} {'?' if par is None else par:>5} "
+                  f"{_quality(res['steps'], par):>8} {res['nodes_expanded']:>10} {res['states_seen']:>10} "
+                  f"{res['elapsed_time']:>8.2f}s", flush=True)
+
+    blob = {
+        "commit": harness.get_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "budget": {"max_states": opts.max_states, "max_expanded": opts.max_expanded, "time_limit": opts.time_limit},
+        "results": results
+    }
+    if opts.out is not None:
+        with open(opts.out, 'w') as f:
+            json.dump(blob, f, indent=2)
+        print(f"INFO: wrote strategy results to {opts.out}")
+    return blob
+
+
+if __name__ == "__main__":
+    main()
@@ -32,8 +32,28 @@ ALL_MOVE_KEYS = MOVE_LEFT + MOVE_RIGHT + MOVE_UP + MOVE_DOWN
 ENTER = (pygame.K_RETURN, pygame.K_SPACE)
 ESCAPE = (pygame.K_ESCAPE,)
 UNDO = (pygame.K_z, pygame.K_BACKSPACE)
+REDO = (pygame.K_x,)
 RESET = (pygame.K_r, pygame.K_RETURN)
 PAUSE = (pygame.K_ESCAPE,)
+HINT = (pygame.K_h,)
+
+# how big (in pixels) each cell of a level is drawn
+CELL_SIZE = 48
+
+# roughly how much memory (in bytes) cached sprites can use before the least recently used ones are dropped
+SPRITE_CACHE_MAX_BYTES = 2 * 1024 * 1024
+
+# roughly how much memory (in bytes) the undo history of a level can use before old steps are forgotten
+UNDO_HISTORY_MAX_BYTES = 4 * 1024 * 1024
+
+# how many steps are remembered so that repeating them (e.g. after an undo) doesn't re-simulate them
+TRANSITION_CACHE_SIZE = 256
+
+# how many milliseconds of each frame can be spent on background work (like searching for hints), at most
+BACKGROUND_WORK_MS = 4
+
+# how many states the hint search can keep in memory before it gives up
+HINT_MAX_STATES = 200000
 
 
 # debug stuff
@@ -1,4 +1,5 @@
 import asyncio
+import multiprocessing
 
 import src.game as game
 
@@ -9,4 +10,6 @@ async def main():
 
 
 if __name__ == "__main__":
+    # hint searches run in worker processes, which (in a frozen exe) start by running this file again
+    multiprocessing.freeze_support()
     asyncio.run( main() )
@@ -80,13 +80,13 @@ def get_color_name(color_id, caps=False):
         return res
 
 
-def rand_color_id(include_white=False, include_brown=False):
+def rand_color_id(include_white=False, include_brown=False, rng=None):
     c_list = [c for c in range(RED_ID, YELLOW_ID + 1)]
     if include_white:
         c_list.append(WHITE_ID)
     if include_brown:
         c_list.append(BROWN_ID)
-    return random.choice(c_list)
+    return (rng or random).choice(c_list)
 
 
 def interpolate(c1, c2, a, steps=None):
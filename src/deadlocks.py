@@ -0,0 +1,178 @@
+import typing
+
+import src.colors as colors
+import src.level as level
+import src.gridsim as gridsim
+
+
+# Enemies can only die by being crushed (i.e. ending up in a cell with a solid of another color). Players never
+# push enemies or potions (they walk into their cells instead), so the only way an enemy can be crushed is if a box
+# pushes it into a solid, moves onto it, or pushes a potion onto it (recoloring it while it's inside a wall). So if
+# no box can ever get next to an enemy, that enemy can never be killed and the level can't be won.
+#
+# The analysis below over-approximates where things can go (ignoring e.g. whether the player can actually reach a
+# box), so it never reports a winnable state as deadlocked. Walls' colors are taken into account, since players,
+# boxes and enemies can pass through walls of their own color.
+#
+# Getting a box next to an enemy isn't always enough, though. A box that's pushed into an enemy's cell pushes the
+# enemy along (boxes never land on enemies of other colors, and don't push enemies of their own color), so if every
+# wall is the enemy's color, it can only be crushed by being pushed into another box of a different color, or off
+# the edge of the level. If neither is possible and no potion can recolor it, it can never be killed.
+
+
+_ENTERABLE_CACHE = {}
+
+
+def _enterable_colors(solids_mask) -> int:
+    """returns: the mask of colors that aren't blocked by any of the given solid colors."""
+    if solids_mask not in _ENTERABLE_CACHE:
+        _ENTERABLE_CACHE[solids_mask] = sum(1 << c for c in range(gridsim.MAX_COLORS)
+                                            if not solids_mask & gridsim._INTERACT_MASK[c])
+    return _ENTERABLE_CACHE[solids_mask]
+
+
+class DeadlockDetector:
+    """Finds states of a level that provably can't be won anymore.
+
+    A detector is tied to the level's gridsim.Board. It caches its analysis of each arrangement of boxes, so
+    checking many states with the same boxes (as a search does) is cheap.
+    """
+
+    def __init__(self, board: gridsim.Board, max_cache_size=100000):
+        self.board = board
+        self.max_cache_size = max_cache_size
+        self._offsets = (-board.width, -1, board.width, 1)
+        self._in_bounds = [board.is_in_bounds(idx) for idx in range(len(board.walls))]
+
+        # the color of every wall, if they're all the same (single) color and they cover the level's edge (so nothing
+        # can be pushed off it), or None
+        wall_colors = 0
+        edge_is_walled = True
+        for idx, walls in enumerate(board.walls):
+            if self._in_bounds[idx]:
+                wall_colors |= walls
+                if walls == 0 and not all(self._in_bounds[idx + offs] for offs in self._offsets):
+                    edge_is_walled = False
+        self._wall_color = None
+        if edge_is_walled and wall_colors != 0 and wall_colors & (wall_colors - 1) == 0:
+            self._wall_color = wall_colors.bit_length() - 1
+
+        # boxes -> (mask of the boxes' colors, color id -> number of cells with boxes of that color,
+        #           {pusher colors mask -> (permanent solids, cells boxes can reach,
+        #                                   {enemy key -> whether it can be killed})})
+        self._cache: typing.Dict[bytes, tuple] = {}
+
+    def release(self) -> typing.List[dict]:
+        """Hands over the cache, replacing it with an empty one (e.g. so that it can be freed a bit at a time).
+        returns: the old cache."""
+        res = [self._cache]
+        self._cache = {}
+        return res
+
+    def is_deadlocked(self, state: gridsim.GridState) -> bool:
+        """returns: True if the state definitely can't be won, or False if it might be winnable."""
+        if state.is_success():
+            return False
+        elif not state.is_player_alive():
+            return True
+
+        if state.boxes not in self._cache:
+            if len(self._cache) >= self.max_cache_size:
+                self._cache.clear()
+            box_cells = [0] * gridsim.MAX_COLORS
+            for box in state.boxes:
+                if box != 0:
+                    box_cells[box & 15] += 1
+            box_colors = sum(1 << color_id for color_id, count in enumerate(box_cells) if count > 0)
+            self._cache[state.boxes] = (box_colors, box_cells, {})
+        box_colors, box_cells, analyses = self._cache[state.boxes]
+
+        # players (and boxes) can push things, and players can be turned into any potion's color.
+        potion_colors = 0
+        for _, color_id in state.potions:
+            potion_colors |= 1 << color_id
+        pusher_colors = potion_colors | box_colors
+        for _, color_id in state.players:
+            pusher_colors |= 1 << color_id
+
+        if pusher_colors not in analyses:
+            solids, reachable = self._analyze_boxes(state.boxes, pusher_colors)
+            analyses[pusher_colors] = (solids, reachable, {})
+        solids, reachable, killable = analyses[pusher_colors]
+
+        for idx, color_id, dx, dy in state.enemies:
+            enemy_key = (idx, dx, dy, potion_colors | (1 << color_id))
+            if enemy_key not in killable:
+                killable[enemy_key] = (state.is_crushed(idx, color_id)
+                                       or self._can_reach_enemy(solids, reachable, *enemy_key))
+            if not killable[enemy_key]:
+                return True
+            elif (color_id == self._wall_color and color_id != colors.BROWN_ID
+                  and potion_colors & ~(1 << color_id) == 0
+                  and sum(box_cells) - box_cells[color_id] <= 1 and not state.is_crushed(idx, color_id)):
+                return True  # nothing can ever crush it (see above)
+        return False
+
+    def _can_push(self, solids, idx, box_color_id, offset, pusher_colors) -> bool:
+        if solids[idx + offset] & gridsim._INTERACT_MASK[box_color_id]:
+            return False  # there's something in the way (that can never move)
+        src_idx = idx - offset
+        return self._in_bounds[src_idx] and _enterable_colors(solids[src_idx]) & pusher_colors != 0
+
+    def _analyze_boxes(self, boxes: bytes, pusher_colors):
+        """returns: (the color mask of the solids in each cell that can never move, the cells boxes can reach)"""
+        solids = list(self.board.walls)
+        movable = {idx: box & 15 for idx, box in enumerate(boxes) if box != 0}
+
+        # boxes that can't be pushed in any direction act like walls, which can make more boxes unpushable
+        changed = True
+        while changed:
+            changed = False
+            for idx, color_id in list(movable.items()):
+                if not any(self._can_push(solids, idx, color_id, offs, pusher_colors) for offs in self._offsets):
+                    solids[idx] |= 1 << color_id
+                    del movable[idx]
+                    changed = True
+
+        reachable = set()
+        for start_idx, color_id in movable.items():
+            seen = {start_idx}
+            to_visit = [start_idx]
+            while len(to_visit) > 0:
+                idx = to_visit.pop()
+                for offs in self._offsets:
+                    if idx + offs not in seen and self._can_push(solids, idx, color_id, offs, pusher_colors):
+                        seen.add(idx + offs)
+                        to_visit.append(idx + offs)
+            reachable.update(seen)
+
+        return solids, reachable
+
+    def _can_reach_enemy(self, solids, reachable, idx, dx, dy, colors_mask) -> bool:
+        # until it's pushed, an enemy stays on its row (or column), between cells that are solid for every color
+        # it could be turned into.
+        line = [idx]
+        if dx != 0 or dy != 0:
+            offset = dy * self.board.width + dx
+            for step in (offset, -offset):
+                cur = idx + step
+                while self._in_bounds[cur] and _enterable_colors(solids[cur]) & colors_mask != 0:
+                    line.append(cur)
+                    cur += step
+
+        for cell in line:
+            if cell in reachable:
+                return True
+            for offs in self._offsets:
+                if cell + offs in reachable:
+                    return True  # a box could push a potion onto it
+        return False
+
+
+def is_deadlocked(state: level.State) -> bool:
+    """returns: True if the state definitely can't be won anymore."""
+    try:
+        grid_state = gridsim.from_state(state)
+    except ValueError:
+        return False  # the level has something gridsim doesn't support, so we can't tell
+    return DeadlockDetector(grid_state.board).is_deadlocked(grid_state)
@@ -1,5 +1,6 @@
 import pygame
 import asyncio
+import time
 import traceback
 
 import configs
@@ -12,6 +13,7 @@ import src.loader as loader
 import src.userdata as userdata
 
 import src.sprites as sprites
+import src.spriteatlas as spriteatlas
 import src.sounds as sounds
 
 
@@ -23,6 +25,7 @@ class Game:
         self.clock = None
 
         self.menu_manager = None
+        self.sprite_baker = None
 
     def get_flags(self):
         if configs.WEB_MODE:
@@ -40,10 +43,17 @@ class Game:
 
         colors.load(colorblind=configs.COLORBLIND_MODE)
         sprites.load()
+        spriteatlas.load()  # if it's missing or out of date, shapes are made from the sprite sheet instead
         sounds.load()
         sounds.play_song(sounds.MAIN_SONG)
         loader.load_levels()
 
+        # the sprites are made while the game runs, so that startup doesn't stall (see below). the levels' ones are
+        # used all the time, so they're kept around for good (unlike e.g. the main menu's big ones)
+        level_sprite_keys = loader.get_sprite_keys(configs.CELL_SIZE)
+        sprites.pin(level_sprite_keys)
+        self.sprite_baker = sprites.SpriteBaker(menus.MainMenu.get_sprite_keys() + level_sprite_keys)
+
         userdata.initialize(configs.DATA_KEY, configs.get_save_mode(),
                             appname=configs.NAME_OF_GAME,
                             appauthor=configs.AUTHOR,
@@ -53,6 +63,7 @@ class Game:
         self.menu_manager = menus.MenuManager(menus.MainMenu())
 
         while running:
+            frame_start_time = time.perf_counter()
             inputs.new_frame(pygame.time.get_ticks() / 1000.0)
             for e in pygame.event.get():
                 if e.type == pygame.QUIT:
@@ -66,11 +77,13 @@ class Game:
                 elif e.type == pygame.MOUSEBUTTONDOWN:
                     inputs.send_mouse_moved(e.pos)
                     inputs.send_mouse_button_down(e.button)
+                elif e.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.menu_manager.force_full_redraw()  # the window's contents may have been lost
 
             if inputs.was_pressed(configs.COLORBLIND_TOGGLE):
                 configs.COLORBLIND_MODE = not configs.COLORBLIND_MODE
                 colors.load(colorblind=configs.COLORBLIND_MODE)
-                sprites.clear_cache()
+                sprites.refresh_colors()
 
             if inputs.was_pressed(configs.MUSIC_TOGGLE):
                 sounds.set_songs_muted(not configs.SONG_MUTED)
@@ -85,17 +98,34 @@ class Game:
 
             self.menu_manager.update(dt)
 
+            # only the parts of the screen that changed are sent to the display (unless it all did)
             screen = pygame.display.get_surface()
-            self.menu_manager.draw(screen)
-
-            pygame.display.flip()
-            pygame.display.set_caption(f"Alien Knightmare [FPS={self.clock.get_fps():.1f}]")
+            dirty_rects = self.menu_manager.draw(screen)
+            if dirty_rects is None:
+                pygame.display.flip()
+            elif len(dirty_rects) > 0:
+                pygame.display.update(dirty_rects)
+            caption = f"Alien Knightmare [FPS={self.clock.get_fps():.1f}]"
+            if not self.sprite_baker.is_done():
+                caption += f" [Loading sprites: {int(100 * self.sprite_baker.get_progress())}%]"
+            pygame.display.set_caption(caption)
+
+            # background work gets whatever's left of the frame (up to a limit), so it never causes a dropped frame
+            frame_time_left = 1 / self.fps - (time.perf_counter() - frame_start_time)
+            time_budget = max(0.0, min(configs.BACKGROUND_WORK_MS / 1000, frame_time_left))
+            if not self.sprite_baker.is_done():
+                if self.sprite_baker.update(time_budget):
+                    print(f"INFO: baked {self.sprite_baker.get_num_sprites()} sprites "
+                          f"in {1000 * self.sprite_baker.get_elapsed_time():.1f}ms")
+            else:
+                self.menu_manager.background_update(time_budget)
 
             await asyncio.sleep(0)
             dt = self.clock.tick(self.fps) / 1000.0
 
             if inputs.was_quit_requested() and not configs.WEB_MODE:
                 print("INFO: quit signal received; quitting")
+                print(f"INFO: {sprites.get_cache()}")
                 running = False
 
 
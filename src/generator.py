@@ -0,0 +1,172 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import time
+import typing
+
+import src.level as level
+import src.loader as loader
+import src.gridsim as gridsim
+import src.deadlocks as deadlocks
+import src.replays as replays
+import src.solutions as solutions
+import src.solver as solver
+import src.utils as utils
+
+
+class Criteria:
+    """Which generated levels are worth keeping."""
+
+    def __init__(self, min_steps=10, max_steps=60, min_branching=1.0, max_branching=2.0):
+        # length of the level's optimal solution
+        self.min_steps = min_steps
+        self.max_steps = max_steps
+
+        # effective branching factor of the search that solved it (i.e. b such that b ** steps = states seen),
+        # which is a rough measure of how many options the player has to consider at each step.
+        self.min_branching = min_branching
+        self.max_branching = max_branching
+
+    def accepts(self, candidate: dict) -> bool:
+        return (candidate["steps"] > 0
+                and self.min_steps <= candidate["steps"] <= self.max_steps
+                and self.min_branching <= candidate["branching"] <= self.max_branching)
+
+
+def make_candidate(seed, dims=(13, 7)) -> level.State:
+    """returns: the level generated from the given seed (the same seed always gives the same level)."""
+    state = loader.make_demo_state2(dims=dims, rng=random.Random(seed))
+    state.name = f"gen-{seed}"
+    return state
+
+
+def evaluate_candidate(seed, dims=(13, 7), max_states=50000) -> dict:
+    """Generates a level and solves it (this is what the worker processes run).
+    returns: the level's stats (and the level itself, as json), with steps=-1 if it couldn't be solved.
+    """
+    state = make_candidate(seed, dims=dims)
+    res = {"seed": seed, "name": state.name, "steps": -1, "branching": 0.0, "states_seen": 0, "moves": None,
+           "level": None, "key": None}
+
+    # don't bother searching levels that are already won or can't possibly be won
+    try:
+        start = gridsim.from_state(state)
+    except ValueError:
+        return res
+    if start.is_success() or deadlocks.DeadlockDetector(start.board).is_deadlocked(start):
+        return res
+
+    try:
+        result = solver.solve(state, max_states=max_states, measure_memory=False)
+    except ValueError:
+        return res  # it reached a situation the simulation doesn't support (e.g. boxes stacked in walls)
+
+    res["states_seen"] = result.states_seen
+    if result.is_solved():
+        res["steps"] = result.num_steps()
+        res["branching"] = result.states_seen ** (1 / max(1, result.num_steps()))
+        res["moves"] = replays.encode(result.moves)
+        res["level"] = state.save_to_json(None)
+        res["key"] = solutions.level_key(state)
+    return res
+
+
+def generate(n_levels, criteria: Criteria, seed=0, dims=(13, 7), workers=None, max_states=50000,
+             max_candidates=None) -> typing.List[dict]:
+    """Generates and solves levels in parallel (using a pool of worker processes) until enough of them pass.
+
+    Candidates are made from consecutive seeds starting at `seed`, so the output only depends on the arguments
+    (and not on the number of workers or how long each search takes).
+
+    returns: the passing candidates (see `evaluate_candidate`), in order of seed.
+    """
+    passed = []
+    next_seed = seed
+    n_evaluated = 0
+    start_time = time.perf_counter()
+
+    max_in_flight = 4 * (workers or os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        while True:
+            while (len(passed) < n_levels and len(in_flight) < max_in_flight
+                   and (max_candidates is None or next_seed - seed < max_candidates)):
+                in_flight.add(pool.submit(evaluate_candidate, next_seed, dims=dims, max_states=max_states))
+                next_seed += 1
+            if len(in_flight) == 0:
+                break
+
+            done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                res = future.result()
+                n_evaluated += 1
+                if criteria.accepts(res):
+                    passed.append(res)
+                    print(f"INFO: seed {res['seed']} passed: steps={res['steps']}, "
+                          f"branching={res['branching']:.3f} ({len(passed)}/{n_levels})")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"INFO: generated {len(passed)} level(s) from {n_evaluated} candidate(s) in {elapsed:.1f}s "
+          f"({3600 * len(passed) / max(elapsed, 1e-6):.0f} per hour)")
+
+    # the last batch can push it over n_levels, so keep the ones with the lowest seeds
+    passed.sort(key=lambda r: r["seed"])
+    return passed[:n_levels]
+
+
+def write_levels(results: typing.List[dict], out_dir, cache: typing.Optional[solutions.SolutionCache] = None):
+    """Saves levels in the same format as assets/levels, and adds their solutions to the given solution cache (if
+    any), so that they have par step counts once they're moved into assets/levels.
+
+    Note that the solutions can't go into out_dir itself, since the game loads every json file in the levels
+    directory as a level.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for res in results:
+        filepath = os.path.join(out_dir, f"{res['name']}.json")
+        with open(filepath, 'w') as f:
+            json.dump(res["level"], f)
+        if cache is not None:
+            cache.put(res["key"], res["name"], res["moves"], res["steps"], res["states_seen"])
+    print(f"INFO: wrote {len(results)} level(s) to {out_dir}")
+    if cache is not None:
+        cache.save()
+
+
+def _main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m src.generator",
+                                     description="Generates random levels and keeps the ones that are solvable "
+                                                 "and about the right difficulty.")
+    parser.add_argument("-n", "--count", type=int, default=10, help="number of levels to generate")
+    parser.add_argument("-o", "--out", default="generated", help="directory to write the levels to")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the first candidate")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--dims", type=int, nargs=2, default=(13, 7), help="size of the levels")
+    parser.add_argument("--steps", type=int, nargs=2, default=(10, 60), help="range of optimal solution lengths")
+    parser.add_argument("--branching", type=float, nargs=2, default=(1.0, 2.0),
+                        help="range of effective branching factors")
+    parser.add_argument("--max-states", type=int, default=50000, help="states to search in each candidate")
+    parser.add_argument("--max-candidates", type=int, default=None, help="give up after this many candidates")
+    parser.add_argument("-c", "--cache", default=None,
+                        help="solution cache to add the levels' solutions to (see src.solutions). Pass the shipped "
+                             f"one ({solutions.CACHE_PATH}) to give the levels pars once they're moved into "
+                             "assets/levels (default: the levels' solutions aren't saved)")
+    opts = parser.parse_args(args)
+
+    criteria = Criteria(min_steps=opts.steps[0], max_steps=opts.steps[1],
+                        min_branching=opts.branching[0], max_branching=opts.branching[1])
+    results = generate(opts.count, criteria, seed=opts.seed, dims=tuple(opts.dims), workers=opts.workers,
+                       max_states=opts.max_states, max_candidates=opts.max_candidates)
+    cache = None
+    if opts.cache is not None:
+        # the shipped cache is an asset, so it's found the same way the game finds it
+        is_shipped = os.path.normpath(opts.cache) == os.path.normpath(solutions.CACHE_PATH)
+        cache = solutions.SolutionCache(utils.asset_path(solutions.CACHE_PATH) if is_shipped else opts.cache)
+    write_levels(results, opts.out, cache=cache)
+    return results
+
+
+if __name__ == "__main__":
+    _main()
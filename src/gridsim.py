@@ -0,0 +1,586 @@
+import array
+import itertools
+import typing
+
+import src.level as level
+import src.colors as colors
+import src.utils as utils
+
+
+# Kinds of (non-solid) pieces. Walls and boxes aren't pieces, they live in the grid layers.
+PLAYER = 0
+ENEMY = 1
+POTION = 2
+
+MAX_COLORS = 16  # color ids must be in [0, MAX_COLORS)
+_ALL_COLORS_MASK = (1 << MAX_COLORS) - 1
+
+# _INTERACT_MASK[c] is the bitmask of colors that color c can interact with (see colors.can_interact)
+_INTERACT_MASK = tuple(sum(1 << c2 for c2 in range(MAX_COLORS) if colors.can_interact(c1, c2))
+                       for c1 in range(MAX_COLORS))
+
+# _CRUSH_MASK[c] is the bitmask of solid colors that crush things of color c (i.e. any other color)
+_CRUSH_MASK = tuple(_ALL_COLORS_MASK ^ (1 << c) for c in range(MAX_COLORS))
+
+
+class Board:
+    """The parts of a level that can't change while it's being played (i.e. its bounds and walls).
+
+    Cells are stored in flat lists indexed by `y * width + x`. The grid is padded by one cell on every side
+    so that things pushed out of bounds have somewhere to go (before they get crushed).
+    """
+
+    def __init__(self, name, bounds, walls: typing.Sequence[int]):
+        self.name = name
+        self.bounds = tuple(bounds)
+        self.width = bounds[2] + 2
+        self.height = bounds[3] + 2
+        if len(walls) != self.width * self.height:
+            raise ValueError(f"expected {self.width * self.height} wall cells, got {len(walls)}")
+        elif len(walls) >= 2 ** 15:
+            raise ValueError(f"level is too big for grid simulation: {bounds}")
+
+        # cell idx -> bitmask of the colors of the walls in that cell (every color for out-of-bounds cells)
+        self.walls = tuple(walls)
+        self._wall_cells: typing.Dict[int, int] = {}  # color id -> see wall_cells
+
+    def idx(self, xy) -> int:
+        return (xy[1] - self.bounds[1] + 1) * self.width + (xy[0] - self.bounds[0] + 1)
+
+    def xy(self, idx) -> typing.Tuple[int, int]:
+        return idx % self.width + self.bounds[0] - 1, idx // self.width + self.bounds[1] - 1
+
+    def is_in_bounds(self, idx) -> bool:
+        x, y = idx % self.width, idx // self.width
+        return 0 < x < self.width - 1 and 0 < y < self.height - 1
+
+    def offset(self, direction) -> int:
+        return direction[1] * self.width + direction[0]
+
+    def wall_cells(self, color_id) -> int:
+        """returns: a bitmask of the cells (bit i is cell idx i) with walls that are solid to the given color."""
+        res = self._wall_cells.get(color_id)
+        if res is None:
+            mask = _INTERACT_MASK[color_id]
+            res = self._wall_cells[color_id] = sum(1 << idx for idx, w in enumerate(self.walls) if w & mask)
+        return res
+
+
+class GridState:
+    """An array-backed version of level.State that's much faster to step (but has no entity identity).
+
+    Boxes are stored in a per-cell layer, as `(box_count << 4) | box_color` (or 0 if the cell has no box).
+    Stacks only ever contain a single color, so the count is all that's needed to track them. The layer is
+    immutable (bytes) and shared between states until a box actually moves.
+
+    Players, enemies and potions can share cells with each other, so they're stored as sorted tuples of
+    (cell_idx, color_id) for players and potions, and (cell_idx, color_id, dx, dy) for enemies. The player's
+    facing direction is stored once on the state instead (it's overwritten by every move before the rules
+    look at it, so it isn't part of the state's key either).
+    """
+
+    def __init__(self, board: Board, boxes: bytes, players=(), enemies=(), potions=(), facing=(0, 1), step=0):
+        self.board = board
+        self.boxes = boxes
+        self.players = players
+        self.enemies = enemies
+        self.potions = potions
+        self.facing = facing
+        self.step = step
+
+        self._key = None
+        self._enemy_step = None  # cached result of _step_enemies
+
+    def copy(self) -> 'GridState':
+        return GridState(self.board, self.boxes, self.players, self.enemies, self.potions,
+                         facing=self.facing, step=self.step)
+
+    def key(self) -> bytes:
+        """returns: a compact encoding that's equal for any two states with the same board."""
+        if self._key is None:
+            pieces = array.array('h', (len(self.players), len(self.enemies)))
+            pieces.extend(itertools.chain.from_iterable(self.players))
+            pieces.extend(itertools.chain.from_iterable(self.enemies))
+            pieces.extend(itertools.chain.from_iterable(self.potions))
+            self._key = self.boxes + pieces.tobytes()
+        return self._key
+
+    def layer_key(self) -> bytes:
+        """returns: a compact encoding of everything but where the (only) player is (see BatchStepper.step_layer).
+            States with the same layer key only differ by their player's position."""
+        (_, color_id), = self.players
+        pieces = array.array('h', (len(self.enemies), color_id))
+        pieces.extend(itertools.chain.from_iterable(self.enemies))
+        pieces.extend(itertools.chain.from_iterable(self.potions))
+        return self.boxes + pieces.tobytes()
+
+    @staticmethod
+    def from_layer_key(board: Board, key: bytes, player_idx, step=0) -> 'GridState':
+        """returns: the state with the given layer key (see layer_key), with its player in the given cell."""
+        n_boxes = board.width * board.height
+        pieces = array.array('h', key[n_boxes:])
+        n_enemies, color_id = pieces[0], pieces[1]
+        enemies = tuple(tuple(pieces[i:i + 4]) for i in range(2, 2 + 4 * n_enemies, 4))
+        potions = tuple(tuple(pieces[i:i + 2]) for i in range(2 + 4 * n_enemies, len(pieces), 2))
+        return GridState(board, key[:n_boxes], ((player_idx, color_id),), enemies, potions, step=step)
+
+    def __eq__(self, other):
+        return isinstance(other, GridState) and self.board is other.board and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.board.name}, step={self.step})"
+
+    def is_player_alive(self):
+        return len(self.players) > 0
+
+    def num_enemies_remaining(self):
+        return len(self.enemies)
+
+    def is_success(self):
+        return len(self.enemies) == 0
+
+    def is_solid(self, idx, for_color_id):
+        mask = _INTERACT_MASK[for_color_id]
+        if self.board.walls[idx] & mask:
+            return True
+        box = self.boxes[idx]
+        return box != 0 and (mask >> (box & 15)) & 1 == 1
+
+    def is_crushed(self, idx, color_id):
+        # crushed if there's a solid of a different color in the cell (out-of-bounds cells contain every color)
+        if self.board.walls[idx] & _CRUSH_MASK[color_id]:
+            return True
+        box = self.boxes[idx]
+        return box != 0 and box & 15 != color_id
+
+    def _push_pieces(self, from_idx, to_idx, pushing_color_id):
+        mask = _INTERACT_MASK[pushing_color_id]
+        for i, p in enumerate(self.players):
+            if p[0] == from_idx and (mask >> p[1]) & 1:
+                if not self.board.is_in_bounds(to_idx):
+                    raise ValueError(f"tried to push a player out of bounds: {self.board.xy(to_idx)}")
+                self.players[i] = (to_idx, p[1])
+        for i, e in enumerate(self.enemies):
+            if e[0] == from_idx and (mask >> e[1]) & 1:
+                if isinstance(self.enemies, tuple):
+                    self.enemies = list(self.enemies)  # copied on write, they're shared with the previous state
+                self.enemies[i] = (to_idx, e[1], e[2], e[3])
+        for i, p in enumerate(self.potions):
+            if p[0] == from_idx and (mask >> p[1]) & 1:
+                if isinstance(self.potions, tuple):
+                    self.potions = list(self.potions)
+                self.potions[i] = (to_idx, p[1])
+
+    def _push_box(self, from_idx, to_idx):
+        box = self.boxes[from_idx]
+        dest_box = self.boxes[to_idx]
+        if dest_box != 0 and dest_box & 15 != box & 15:
+            raise ValueError(f"cannot stack boxes with different colors at {self.board.xy(to_idx)}")
+        elif box + (dest_box & ~15) >= 256:
+            raise ValueError(f"too many boxes stacked at {self.board.xy(to_idx)}")
+        boxes = bytearray(self.boxes)
+        boxes[from_idx] = 0
+        boxes[to_idx] = box + (dest_box & ~15)
+        self.boxes = bytes(boxes)
+
+    def try_to_push_cell_contents_recursively(self, start_idx, offset, pushing_color_id) -> bool:
+        """returns: whether the pusher can enter this cell"""
+        dest_idx = start_idx + offset
+        if not self.is_solid(start_idx, pushing_color_id):
+            self._push_pieces(start_idx, dest_idx, pushing_color_id)
+            return True
+        elif self.board.walls[start_idx] & _INTERACT_MASK[pushing_color_id]:
+            return False  # it's solid and not pushable, can't enter
+        else:
+            # the only solid thing we interact with here is a box
+            box_color_id = self.boxes[start_idx] & 15
+            walls = self.board.walls[start_idx]
+            if walls != 0 and walls != 1 << box_color_id:
+                raise ValueError(f"pushing a number of solid colors != 1 at {self.board.xy(start_idx)}")
+            if self.try_to_push_cell_contents_recursively(dest_idx, offset, box_color_id):
+                self._push_box(start_idx, dest_idx)
+                self._push_pieces(start_idx, dest_idx, pushing_color_id)
+                return True
+            else:
+                return False
+
+    def _try_to_move_player(self, player_dir):
+        self.facing = player_dir
+        if player_dir == (0, 0):
+            return
+        offset = self.board.offset(player_dir)
+        for i in range(len(self.players)):
+            idx, color_id = self.players[i]
+            dest_idx = idx + offset
+            if (not self.is_solid(dest_idx, color_id)
+                    or self.try_to_push_cell_contents_recursively(dest_idx, offset, color_id)):
+                self.players[i] = (dest_idx, color_id)
+
+    def _apply_potions(self, pieces, used_potion_cells: typing.Set[int]):
+        """returns: the given players or enemies, recolored by any potions in their cells."""
+        if len(self.potions) == 0:
+            return pieces
+        pot_colors = {}
+        for idx, color_id in self.potions:
+            if idx not in pot_colors:
+                pot_colors[idx] = [color_id]
+            else:
+                pot_colors[idx].append(color_id)
+        res = list(pieces)
+        for i, p in enumerate(res):
+            colors_here = pot_colors.get(p[0])
+            if colors_here is not None and any(c != p[1] for c in colors_here):
+                used_potion_cells.add(p[0])
+                if p[1] not in colors_here:
+                    res[i] = (p[0], max(colors_here)) + p[2:]
+        return res
+
+    def _kill_players(self, players, enemies, enemies_have_moved):
+        """returns: the players that weren't killed by an enemy in their cell."""
+        if len(enemies) == 0:
+            return players
+        fx, fy = self.facing
+        alive = []
+        for p in players:
+            mask = _INTERACT_MASK[p[1]]
+            for e in enemies:
+                if (e[0] == p[0] and (mask >> e[1]) & 1
+                        and (enemies_have_moved or (fx + e[2] == 0 and fy + e[3] == 0))):
+                    break
+            else:
+                alive.append(p)
+        return alive
+
+    def _step_enemies(self):
+        """Runs the parts of the rules that don't depend on the players (once they've finished moving).
+
+        returns: (enemies before they're crushed in (6), enemies before they're crushed in (10), the cells of
+                  potions the enemies consumed)
+        """
+        board = self.board
+        width = board.width
+        walls = board.walls
+        boxes = self.boxes
+        used_potion_cells = set()
+
+        # (3) enemies turn (is_solid and is_crushed are inlined here, since this is the hottest part of a search)
+        turned = []
+        for e in self.enemies:
+            idx, color_id, dx, dy = e
+            if dx != 0 or dy != 0:
+                dest_idx = idx + dy * width + dx
+                mask = _INTERACT_MASK[color_id]
+                if not board.is_in_bounds(idx):
+                    e = (idx, color_id, -dx, -dy)
+                else:
+                    box = boxes[dest_idx]
+                    if walls[dest_idx] & mask or (box != 0 and (mask >> (box & 15)) & 1):
+                        e = (idx, color_id, -dx, -dy)
+            turned.append(e)
+
+        turned = self._apply_potions(turned, used_potion_cells)  # (4)
+
+        # (6, 7) crushed enemies are removed, then the rest move
+        moved = []
+        for e in turned:
+            idx, color_id, dx, dy = e
+            box = boxes[idx]
+            if walls[idx] & _CRUSH_MASK[color_id] or (box != 0 and box & 15 != color_id):
+                continue
+            if dx != 0 or dy != 0:
+                dest_idx = idx + dy * width + dx
+                mask = _INTERACT_MASK[color_id]
+                box = boxes[dest_idx]
+                if not (walls[dest_idx] & mask or (box != 0 and (mask >> (box & 15)) & 1)):
+                    e = (dest_idx, color_id, dx, dy)
+            moved.append(e)
+
+        moved = self._apply_potions(moved, used_potion_cells)  # (8)
+        return turned, moved, used_potion_cells
+
+    def get_next(self, player_dir) -> 'GridState':
+        # Same rules as level.State.get_next
+        res = GridState(self.board, self.boxes, list(self.players), self.enemies, self.potions,
+                        facing=self.facing, step=self.step + 1)
+
+        res._try_to_move_player(player_dir)  # (1, 2)
+
+        # the enemies' part of the step only depends on the players if something got pushed, so
+        # it can be shared between all the moves that don't push anything.
+        if res.boxes is self.boxes and res.enemies is self.enemies and res.potions is self.potions:
+            if self._enemy_step is None:
+                self._enemy_step = self._step_enemies()
+            res._finish_step(self._enemy_step)
+        else:
+            res._finish_step(res._step_enemies())
+        return res
+
+    def _finish_step(self, enemy_step):
+        """Runs the rest of the rules, once the players have moved and the enemies' part of the step is known."""
+        turned, moved, enemy_pot_cells = enemy_step
+        used_pot_cells = set(enemy_pot_cells)
+        players = self._apply_potions(self.players, used_pot_cells)  # (4)
+        players = self._kill_players(players, turned, False)  # (5)
+        players = self._apply_potions(players, used_pot_cells)  # (8)
+        players = self._kill_players(players, moved, True)  # (9)
+
+        # (10)
+        self.players = tuple(sorted(players))
+        self.enemies = tuple(sorted(e for e in moved if not self.is_crushed(e[0], e[1])))
+        self.potions = tuple(sorted(p for p in self.potions
+                                    if p[0] not in used_pot_cells and not self.is_crushed(p[0], p[1])))
+
+    def to_state(self) -> level.State:
+        board = self.board
+        res = level.State(board.name, step=self.step, bounds=board.bounds)
+        for idx in range(board.width * board.height):
+            if not board.is_in_bounds(idx):
+                continue
+            xy = board.xy(idx)
+            walls = board.walls[idx]
+            for c in range(MAX_COLORS):
+                if walls & (1 << c):
+                    res.add_entity(xy, level.Wall(color_id=c))
+            box = self.boxes[idx]
+            for _ in range(box >> 4):
+                res.add_entity(xy, level.Box(color_id=box & 15))
+
+        for idx, color_id in self.players:
+            player = level.Player(color_id)
+            player.set_direction(self.facing)
+            res.add_entity(board.xy(idx), player)
+        for idx, color_id, dx, dy in self.enemies:
+            res.add_entity(board.xy(idx), level.Enemy(color_id, (dx, dy)))
+        for idx, color_id in self.potions:
+            res.add_entity(board.xy(idx), level.Potion(color_id))
+        return res
+
+
+class BatchStepper:
+    """Steps many states at once (e.g. a whole layer of a search's frontier, in every direction).
+
+    Gives the same results as calling GridState.get_next on each state, but shares work between them. The
+    enemies' part of a step only depends on the "world" (i.e. the boxes, enemies and potions), which tends to be
+    the same for many states in a search (the ones that only differ by where the player is), and as long as the
+    player doesn't push anything, the whole step only depends on the world and where the player moves to. So
+    those results are computed once per world (or per world and player position) and reused.
+
+    Caches are kept between calls (and cleared once they get bigger than max_cache_size).
+    """
+
+    def __init__(self, board: Board, max_cache_size=100000):
+        self.board = board
+        self.max_cache_size = max_cache_size
+
+        # (boxes, enemies, potions) -> (world id, a state with that world)
+        self._worlds: typing.Dict[tuple, typing.Tuple[int, GridState]] = {}
+        # (world id, players after moving, direction) -> successor
+        self._steps: typing.Dict[tuple, GridState] = {}
+        # (boxes, color id) -> bitmask of the cells with boxes that are solid to that color
+        self._box_cells: typing.Dict[tuple, int] = {}
+
+    def release(self) -> typing.List[dict]:
+        """Hands over the caches, replacing them with empty ones (e.g. so that they can be freed a bit at a time).
+        returns: the old caches."""
+        res = [self._worlds, self._steps, self._box_cells]
+        self._worlds, self._steps, self._box_cells = {}, {}, {}
+        return res
+
+    def step(self, states: typing.Sequence[GridState], directions,
+             skip: typing.Container[bytes] = ()) -> typing.Tuple[typing.List[bytes], typing.List[GridState]]:
+        """Args:
+            states: the states to step.
+            directions: the moves to make from each state.
+            skip: keys of states the caller isn't interested in (e.g. ones a search has already seen). Their
+                successors aren't built (which saves a lot of time when most of them are duplicates).
+        returns: (keys, successors), where successors[i * len(directions) + j] is the result of
+                 states[i].get_next(directions[j]) (or None if its key is in skip), and keys has each one's key.
+        """
+        if len(self._worlds) > self.max_cache_size or len(self._steps) > self.max_cache_size:
+            self._worlds.clear()
+            self._steps.clear()
+
+        board = self.board
+        walls = board.walls
+        worlds = self._worlds
+        steps = self._steps
+        offsets = [board.offset(d) for d in directions]
+        keys = []
+        successors = []
+
+        for state in states:
+            world_key = (state.boxes, state.enemies, state.potions)
+            world_id, world = worlds.get(world_key) or worlds.setdefault(world_key, (len(worlds), state))
+
+            boxes = state.boxes
+            turned = None
+            for direction, offset in zip(directions, offsets):
+                # find where the players move to, unless one of them would push something
+                moved = []
+                for p in state.players:
+                    dest_idx = p[0] + offset
+                    mask = _INTERACT_MASK[p[1]]
+                    if offset == 0 or walls[dest_idx] & mask:
+                        moved.append(p)  # (walls can't be pushed, so pushing against one does nothing)
+                    elif boxes[dest_idx] != 0 and (mask >> (boxes[dest_idx] & 15)) & 1:
+                        break
+                    else:
+                        moved.append((dest_idx, p[1]))
+                else:
+                    if world._enemy_step is None:
+                        world._enemy_step = world._step_enemies()
+                    if turned is None:
+                        turned = set(e[0] for e in world._enemy_step[0])
+
+                    # the direction only matters if a player starts the enemies' turn in the same cell as one
+                    moved = tuple(moved)
+                    step_key = (world_id, moved, direction if any(p[0] in turned for p in moved) else None)
+                    cached = steps.get(step_key)
+                    if cached is None:
+                        cached = GridState(board, boxes, moved, state.enemies, state.potions, facing=direction)
+                        cached._finish_step(world._enemy_step)
+                        cached.key()
+                        steps[step_key] = cached
+
+                    keys.append(cached._key)
+                    if cached._key in skip:
+                        successors.append(None)
+                    else:
+                        nxt = GridState(board, cached.boxes, cached.players, cached.enemies, cached.potions,
+                                        facing=direction, step=state.step + 1)
+                        nxt._key = cached._key
+                        successors.append(nxt)
+                    continue
+
+                nxt = state.get_next(direction)
+                keys.append(nxt.key())
+                successors.append(None if nxt.key() in skip else nxt)
+
+        return keys, successors
+
+    def step_layer(self, state: GridState, cells: int, directions) -> typing.Tuple[int, GridState, list]:
+        """Steps a whole layer of states at once, i.e. the states that are the same as the given one (which must have
+        exactly one player), except that the player can be in any of the given cells (bit i of cells is cell idx i).
+
+        Players that move without pushing anything or touching a potion don't change the world, so where they end
+        up (and whether they're killed) is worked out for all of them at once with bitwise operations, and they
+        all share one successor world. The rest are stepped one at a time.
+
+        returns: (moved_cells, world, others), where moved_cells is a bitmask of where the players that only moved
+                 end up (if they survive), world is their successor (with its player in the first of those cells,
+                 or None if there aren't any), and others is the successors of the rest (in no particular order).
+        """
+        if len(state.players) != 1:
+            raise ValueError(f"layers need exactly one player, got {len(state.players)}")
+        (_, color_id), = state.players
+        board = self.board
+        if state._enemy_step is None:
+            state._enemy_step = state._step_enemies()
+        turned, moved, _ = state._enemy_step
+
+        # cells where the player would be killed by an enemy in (5) (which depends on which way it's facing), or (9)
+        mask = _INTERACT_MASK[color_id]
+        killed_facing: typing.Dict[tuple, int] = {}
+        for e_idx, e_color_id, dx, dy in turned:
+            if (mask >> e_color_id) & 1:
+                killed_facing[(-dx, -dy)] = killed_facing.get((-dx, -dy), 0) | (1 << e_idx)
+        killed = 0
+        for e in moved:
+            if (mask >> e[1]) & 1:
+                killed |= 1 << e[0]
+
+        walls = board.wall_cells(color_id)
+        box_key = (state.boxes, color_id)
+        boxes = self._box_cells.get(box_key)
+        if boxes is None:
+            if len(self._box_cells) > self.max_cache_size:
+                self._box_cells.clear()
+            boxes = self._box_cells[box_key] = sum(1 << idx for idx, b in enumerate(state.boxes)
+                                                   if b != 0 and (mask >> (b & 15)) & 1)
+        potions = 0  # cells with potions that would recolor the player (or be used up by it)
+        for idx, p_color_id in state.potions:
+            if p_color_id != color_id:
+                potions |= 1 << idx
+
+        moved_cells = 0
+        others = []
+        for direction in directions:
+            offset = board.offset(direction)
+            dest = cells << offset if offset >= 0 else cells >> -offset
+            blocked = dest & walls  # (walls can't be pushed, so the player stays where it is)
+            pushing = dest & boxes & ~walls
+            dest &= ~(walls | boxes)
+            if offset >= 0:
+                blocked >>= offset
+                pushing >>= offset
+                touching = (dest & potions) >> offset
+            else:
+                blocked <<= -offset
+                pushing <<= -offset
+                touching = (dest & potions) << -offset
+            after = dest | blocked
+            moved_cells |= after & ~(potions | killed | killed_facing.get(direction, 0))
+
+            special = pushing | touching | (blocked & potions)
+            while special != 0:
+                low = special & -special
+                special ^= low
+                cur = GridState(board, state.boxes, ((low.bit_length() - 1, color_id),), state.enemies,
+                                state.potions, facing=state.facing, step=state.step)
+                cur._enemy_step = state._enemy_step
+                others.append(cur.get_next(direction))
+
+        world = None
+        if moved_cells != 0:
+            world = GridState(board, state.boxes, (), state.enemies, state.potions, step=state.step + 1)
+            world._finish_step(state._enemy_step)
+            world.players = (((moved_cells & -moved_cells).bit_length() - 1, color_id),)
+        return moved_cells, world, others
+
+
+def from_state(state: level.State) -> GridState:
+    bounds = state.get_area()
+    width, height = bounds[2] + 2, bounds[3] + 2
+    walls = [_ALL_COLORS_MASK] * (width * height)
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            walls[y * width + x] = 0
+
+    ents = list(state.all_entity_positions())
+    for ent, xy in ents:
+        if not utils.rect_contains(bounds, xy):
+            raise ValueError(f"{ent} is out of bounds: {xy}")
+        if not 0 <= ent.color_id < MAX_COLORS:
+            raise ValueError(f"{ent} has an unsupported color: {ent.color_id}")
+        if isinstance(ent, level.Wall):
+            walls[(xy[1] - bounds[1] + 1) * width + (xy[0] - bounds[0] + 1)] |= 1 << ent.color_id
+
+    board = Board(state.name, bounds, walls)
+    boxes = bytearray(width * height)
+    players, enemies, potions = [], [], []
+    facing = (0, 1)
+
+    for ent, xy in ents:
+        idx = board.idx(xy)
+        if isinstance(ent, level.Wall):
+            continue
+        elif isinstance(ent, level.Box):
+            box = boxes[idx]
+            if box != 0 and box & 15 != ent.color_id:
+                raise ValueError(f"cannot stack boxes with different colors at {xy}")
+            boxes[idx] = box + (1 << 4) if box != 0 else (1 << 4) | ent.color_id
+        elif isinstance(ent, level.Player):
+            facing = ent.direction
+            players.append((idx, ent.color_id))
+        elif isinstance(ent, level.Enemy):
+            enemies.append((idx, ent.color_id, ent.direction[0], ent.direction[1]))
+        elif isinstance(ent, level.Potion):
+            potions.append((idx, ent.color_id))
+        else:
+            raise ValueError(f"grid simulation doesn't support {type(ent).__name__}")
+
+    return GridState(board, bytes(boxes), tuple(sorted(players)), tuple(sorted(enemies)), tuple(sorted(potions)),
+                     facing=facing, step=state.step)
@@ -0,0 +1,124 @@
+import typing
+
+import src.gridsim as gridsim
+
+
+# Estimates of the number of steps it'll take to win from a state, for guiding searches (see src.solver).
+#
+# Admissible heuristics never overestimate, so A* and IDA* still find optimal solutions with them. They rely on
+# the fact that enemies can only be killed by boxes (see src.deadlocks): something has to be pushed before any
+# enemy that isn't already being crushed can die, and each box (and each enemy) moves at most one cell per step.
+
+
+_BOX_CELLS_CACHE: typing.Dict[bytes, typing.List[typing.Tuple[int, int]]] = {}
+
+
+def _box_cells(state: gridsim.GridState) -> typing.List[typing.Tuple[int, int]]:
+    """returns: the (x, y) of every cell with a box in it."""
+    res = _BOX_CELLS_CACHE.get(state.boxes)
+    if res is None:
+        if len(_BOX_CELLS_CACHE) > 100000:
+            _BOX_CELLS_CACHE.clear()
+        width = state.board.width
+        res = [(idx % width, idx // width) for idx, box in enumerate(state.boxes) if box != 0]
+        _BOX_CELLS_CACHE[state.boxes] = res
+    return res
+
+
+_CRUSHER_CELLS_CACHE: typing.Dict[tuple, typing.List[typing.Tuple[int, int]]] = {}
+
+
+def _crusher_cells(state: gridsim.GridState, color_id) -> typing.List[typing.Tuple[int, int]]:
+    """returns: the (x, y) of every cell with a box that could crush an enemy of the given color (i.e. one of
+        another color), or of every box if there aren't any (since a potion could recolor the enemy)."""
+    res = _CRUSHER_CELLS_CACHE.get((state.boxes, color_id))
+    if res is None:
+        if len(_CRUSHER_CELLS_CACHE) > 100000:
+            _CRUSHER_CELLS_CACHE.clear()
+        width = state.board.width
+        res = [(idx % width, idx // width) for idx, box in enumerate(state.boxes)
+               if box != 0 and box & 15 != color_id] or _box_cells(state)
+        _CRUSHER_CELLS_CACHE[(state.boxes, color_id)] = res
+    return res
+
+
+def _min_distance(xy, cells) -> int:
+    return min(abs(xy[0] - x) + abs(xy[1] - y) for x, y in cells)
+
+
+def zero(state: gridsim.GridState) -> int:
+    return 0
+
+
+def enemies_remaining(state: gridsim.GridState) -> int:
+    """Not admissible (one push can crush several enemies), but good for weighted A* and beam search."""
+    return len(state.enemies)
+
+
+def enemy_progress(state: gridsim.GridState) -> int:
+    """Not admissible, but good for beam search: the number of enemies left, then the total distance from each of
+    them to the nearest box that could crush it (which has to get next to it to kill it)."""
+    width = state.board.width
+    total = 0
+    for idx, color_id, _, _ in state.enemies:
+        boxes = _crusher_cells(state, color_id)
+        if len(boxes) > 0:
+            total += _min_distance((idx % width, idx // width), boxes)
+    # there are fewer enemies than cells, and each one's distance is less than the number of cells, so killing an
+    # enemy always counts for more than moving boxes closer to the rest
+    max_total = len(state.board.walls) * len(state.board.walls)
+    return len(state.enemies) * max_total + total
+
+
+def push_distance(state: gridsim.GridState) -> int:
+    """The number of steps until a player could push a box (i.e. walk into its cell), unless every enemy is
+    already being crushed."""
+    if state.is_success():
+        return 0
+    boxes = _box_cells(state)
+    if len(boxes) == 0 or len(state.players) == 0 or all(state.is_crushed(e[0], e[1]) for e in state.enemies):
+        return 1
+    width = state.board.width
+    return max(1, min(_min_distance((p[0] % width, p[0] // width), boxes) for p in state.players))
+
+
+def box_enemy_distance(state: gridsim.GridState) -> int:
+    """The number of steps until a box could get close enough to the farthest enemy to kill it.
+
+    An enemy dies when a box pushes it into something, lands on it, or pushes a potion onto it (which it can
+    also walk into), so a box has to be within two cells of it. Each step, the gap can only close by one cell
+    per box move plus one per enemy move (or by more if several players are pushing things at once, in which
+    case this gives up).
+    """
+    if state.is_success():
+        return 0
+    boxes = _box_cells(state)
+    if len(boxes) == 0 or len(state.players) != 1:
+        return 1
+    width = state.board.width
+    res = 1
+    for idx, color_id, dx, dy in state.enemies:
+        if state.is_crushed(idx, color_id):
+            continue
+        dist = _min_distance((idx % width, idx // width), boxes)
+        speed = 1 if (dx != 0 or dy != 0) else 0
+        res = max(res, 1 + max(0, -(-(dist - 3) // (1 + speed))))
+    return res
+
+
+def combined(state: gridsim.GridState) -> int:
+    return max(push_distance(state), box_enemy_distance(state))
+
+
+# name -> heuristic
+HEURISTICS: typing.Dict[str, typing.Callable[[gridsim.GridState], int]] = {
+    "zero": zero,
+    "enemies": enemies_remaining,
+    "progress": enemy_progress,
+    "push": push_distance,
+    "box-enemy": box_enemy_distance,
+    "combined": combined,
+}
+
+# the ones that never overestimate
+ADMISSIBLE = ("zero", "push", "box-enemy", "combined")
@@ -0,0 +1,202 @@
+import collections
+import gc
+import multiprocessing
+import signal
+import time
+import typing
+
+import src.level as level
+import src.gridsim as gridsim
+import src.solver as solver
+import src.solutions as solutions
+
+
+# statuses of a HintEngine
+READY = "ready"  # the next move is known
+THINKING = "thinking"  # a search for it is still running
+UNAVAILABLE = "unavailable"  # the level can't be won from here (or the search gave up, or hints aren't supported)
+
+
+def _search_in_worker(conn, start: gridsim.GridState, max_states):
+    """Runs a hint search in a worker process, and sends back its moves (or None) when it's done."""
+    # forked workers inherit pygame's signal handlers, which would stop them from being terminated
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    search = solver.AStarSolver(start, heuristic="combined", max_states=max_states)
+    search.run()
+    conn.send(search.get_moves())
+    conn.close()
+
+
+class HintEngine:
+    """Finds the next move of an optimal solution from the state a level is currently in, without blocking.
+
+    In-process searches are advanced a little at a time by `update`, which is given a time budget (so that the
+    game can fit the work into the frames' spare time). Otherwise, searches run in a worker process (which isn't
+    possible in web mode) and `update` just checks whether they're done.
+
+    Every state along each solution that's found is remembered, so as long as the player keeps following the
+    hints (or undoes back onto a solution), the next hint is known immediately. The shipped level's known solution
+    (see src.solutions) is used too, so hints from a level's initial state are free.
+    """
+
+    def __init__(self, initial_state: level.State, use_process=True, max_states=200000):
+        self.use_process = use_process
+        self.max_states = max_states
+
+        self._board = None
+        self._next_moves: typing.Dict[bytes, typing.Tuple[int, int]] = {}  # state key -> next move
+        self._failed: typing.Set[bytes] = set()  # keys of states with no (findable) solution
+
+        self._cur_state = None
+        self._cur_key = None
+
+        # the search that's running, if any
+        self._search_key = None
+        self._search_start: typing.Optional[gridsim.GridState] = None
+        self._search: typing.Optional[solver.Solver] = None
+        self._process = None
+        self._conn = None
+
+        # containers from old in-process searches, which are freed a bit at a time (since freeing a whole search at
+        # once can take tens of milliseconds)
+        self._retired: typing.List[typing.Union[dict, list, set, collections.deque]] = []
+        self._froze_gc = False  # whether the engine has frozen the garbage collector (see update)
+
+        try:
+            start = gridsim.from_state(initial_state)
+        except ValueError:
+            return
+        self._board = start.board
+        moves = solutions.get_solution(initial_state) if initial_state.step == 0 else None
+        if moves is not None:
+            self._add_solution(start, moves)
+
+    def set_state(self, state: level.State):
+        """Sets the state to find hints for (and starts searching from it, if its hint isn't already known)."""
+        if state is self._cur_state:
+            return
+        self._cur_state = state
+        self._cur_key = None
+        if self._board is None:
+            return
+        try:
+            start = gridsim.from_state(state)
+        except ValueError:
+            return
+        if start.board.walls != self._board.walls or start.board.bounds != self._board.bounds:
+            # the level was edited, so none of the known solutions apply anymore
+            self._stop_search()
+            self._board = start.board
+            self._next_moves.clear()
+            self._failed.clear()
+
+        self._cur_key = start.key()
+        if self._cur_key == self._search_key or self._cur_key in self._next_moves or self._cur_key in self._failed:
+            return
+        elif start.is_success() or not start.is_player_alive():
+            self._failed.add(self._cur_key)
+            return
+
+        # the old search (if there is one) isn't needed anymore
+        self._stop_search()
+        self._search_key = self._cur_key
+        self._search_start = start
+        if self.use_process:
+            self._conn, child_conn = multiprocessing.Pipe(duplex=False)
+            self._process = multiprocessing.Process(target=_search_in_worker, daemon=True,
+                                                    args=(child_conn, start, self.max_states))
+            self._process.start()
+            child_conn.close()
+        else:
+            self._search = solver.AStarSolver(start, heuristic="combined", max_states=self.max_states)
+
+    def update(self, time_budget):
+        """Advances the search for up to time_budget seconds (if it's running in-process)."""
+        end_time = time.perf_counter() + time_budget
+        self._free_retired(end_time)
+        if self._search_key is None:
+            return
+        elif self._process is not None:
+            if self._conn.poll():
+                moves = self._conn.recv()
+                self._finish_search(moves)
+            elif not self._process.is_alive():
+                self._finish_search(None)  # it crashed
+        else:
+            while time.perf_counter() < end_time:
+                if self._search.step(max_nodes=4):
+                    self._finish_search(self._search.get_moves())
+                    break
+            else:
+                # the search's states are kept out of the garbage collector's way until it's done, because full
+                # collections have to look at all of them (which can take 100ms+). New states are made every
+                # frame, so they're frozen every frame. This is skipped if something else froze the collector,
+                # since it all gets unfrozen at once afterwards.
+                if self._froze_gc or gc.get_freeze_count() == 0:
+                    gc.freeze()
+                    self._froze_gc = True
+
+    def get_status(self) -> str:
+        if self._cur_key is None or self._cur_key in self._failed:
+            return UNAVAILABLE
+        return READY if self._cur_key in self._next_moves else THINKING
+
+    def get_hint(self) -> typing.Optional[typing.Tuple[int, int]]:
+        """returns: the next move of an optimal solution from the current state, if it's known."""
+        return self._next_moves.get(self._cur_key)
+
+    def close(self):
+        self._stop_search()
+        self._retired.clear()
+        self._unfreeze_gc()
+
+    def _add_solution(self, start: gridsim.GridState, moves):
+        state = start
+        for move in moves:
+            self._next_moves[state.key()] = move
+            state = state.get_next(move)
+            if not state.is_player_alive():
+                break  # the solution doesn't match the simulation (which shouldn't happen)
+
+    def _retire(self, search: solver.Solver):
+        self._retired.extend(search.release())
+
+    def _free_retired(self, end_time):
+        while len(self._retired) > 0 and time.perf_counter() < end_time:
+            container = self._retired[-1]
+            if isinstance(container, dict):
+                for _ in range(min(1000, len(container))):
+                    container.popitem()
+            else:
+                for _ in range(min(1000, len(container))):
+                    container.pop()
+            if len(container) == 0:
+                self._retired.pop()
+        if len(self._retired) == 0 and self._search is None:
+            self._unfreeze_gc()
+
+    def _unfreeze_gc(self):
+        if self._froze_gc:
+            gc.unfreeze()
+            self._froze_gc = False
+
+    def _finish_search(self, moves):
+        key, start = self._search_key, self._search_start
+        self._stop_search()
+        if moves is None:
+            self._failed.add(key)
+        else:
+            self._add_solution(start, moves)
+
+    def _stop_search(self):
+        if self._search is not None:
+            self._retire(self._search)
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.kill()
+            self._conn.close()
+        self._process = None
+        self._conn = None
+        self._search = None
+        self._search_key = None
+        self._search_start = None
@@ -0,0 +1,186 @@
+import typing
+
+import src.level as level
+
+
+# a full copy of the state is kept every this many steps
+KEYFRAME_INTERVAL = 32
+
+# rough sizes used to keep the history under its memory budget (in bytes)
+_DELTA_BYTES = 200
+_KEYFRAME_BYTES = 600
+_ENTITY_BYTES = 200
+
+
+class Delta:
+    """The difference between a state and the one after it.
+
+    Only dynamic entities are tracked (the terrain can't change during play). An entity that moved or changed
+    is recorded as being removed from its old cell and re-added in its new one.
+    """
+
+    __slots__ = ('removed', 'added', 'step')
+
+    def __init__(self, removed, added, step):
+        self.removed: typing.Tuple[typing.Tuple[typing.Tuple[int, int], level.Entity], ...] = removed
+        self.added: typing.Tuple[typing.Tuple[typing.Tuple[int, int], level.Entity], ...] = added
+        self.step = step
+
+    def num_bytes(self) -> int:
+        return _DELTA_BYTES + _ENTITY_BYTES * len(self.added) + 16 * len(self.removed)
+
+    def apply(self, state: level.State):
+        for xy, ent in self.removed:
+            state.remove_entity(xy, ent)
+        for xy, ent in self.added:
+            state.add_entity(xy, ent.copy(), ignore_bounds=True)
+        state.step = self.step
+
+
+def _is_same(e1: level.Entity, e2: level.Entity) -> bool:
+    return (e1.ent_id == e2.ent_id and e1.color_id == e2.color_id
+            and e1.direction == e2.direction and e1.art_direction == e2.art_direction)
+
+
+def compute_delta(old_state: level.State, new_state: level.State) -> Delta:
+    old_ents = {e.uid: (e, xy) for e, xy in old_state.all_entity_positions() if not e.is_static()}
+    removed = []
+    added = []
+    for e, xy in new_state.all_entity_positions():
+        if e.is_static():
+            continue
+        old = old_ents.pop(e.uid, None)
+        if old is None:
+            added.append((xy, e))
+        elif old[1] != xy or not _is_same(old[0], e):
+            removed.append((old[1], old[0]))
+            added.append((xy, e))
+    for e, xy in old_ents.values():
+        removed.append((xy, e))
+    return Delta(tuple(removed), tuple(added), new_state.step)
+
+
+def _keyframe_bytes(state: level.State) -> int:
+    # the terrain is shared with the live state, so only the dynamic entities count
+    return _KEYFRAME_BYTES + _ENTITY_BYTES * sum(len(ents) for ents in state.level.values())
+
+
+class History:
+    """The states a level has been in, for undoing and redoing.
+
+    Rather than keeping every state, it stores a delta per step plus a full copy of the state every
+    KEYFRAME_INTERVAL steps. States are rebuilt from the nearest keyframe when they're needed again. If the
+    history grows past max_bytes, its oldest keyframes (and their deltas) are dropped.
+
+    The moves that led to each state are kept for the whole history (they're tiny), so that it can be replayed.
+    """
+
+    def __init__(self, state: level.State, max_bytes=None, keyframe_interval=KEYFRAME_INTERVAL):
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+
+        self._cur = state
+        self._cur_idx = 0
+        self._first_idx = 0  # index of the oldest state that can still be restored
+
+        self._keyframes: typing.Dict[int, level.State] = {}  # idx -> state
+        self._deltas: typing.List[Delta] = []  # self._deltas[i] turns state (first_idx + i) into the next one
+        self._num_bytes = 0
+        self._moves = []  # self._moves[i] is the move that turned state i into the next one (or None if unknown)
+
+        state.prev = None
+        self._add_keyframe(0, state)
+
+    def current(self) -> level.State:
+        return self._cur
+
+    def num_bytes(self) -> int:
+        """returns: the (approximate) memory used by the history."""
+        return self._num_bytes
+
+    def can_undo(self) -> bool:
+        return self._cur_idx > self._first_idx
+
+    def can_redo(self) -> bool:
+        return self._cur_idx < self._first_idx + len(self._deltas)
+
+    def get_moves(self) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        """returns: the moves that lead from the first state to the current one, or None if any are unknown."""
+        res = self._moves[:self._cur_idx]
+        return None if None in res else res
+
+    def push(self, state: level.State, move=None):
+        """Adds a state after the current one (discarding anything that could be redone).
+
+        Args:
+            state: the new state.
+            move: the direction that was input to reach it, if it's a normal step.
+        """
+        if self.can_redo():
+            self._truncate(self._cur_idx)
+        del self._moves[self._cur_idx:]
+        self._moves.append(move)
+
+        self._deltas.append(compute_delta(self._cur, state))
+        self._num_bytes += self._deltas[-1].num_bytes()
+        self._cur_idx += 1
+        self._cur = state
+        state.prev = None  # the history takes care of the previous states
+
+        if self._cur_idx % self.keyframe_interval == 0:
+            self._add_keyframe(self._cur_idx, state)
+        self._drop_old_history()
+
+    def undo(self) -> typing.Optional[level.State]:
+        """returns: the previous state, or None if there isn't one."""
+        if not self.can_undo():
+            return None
+        self._cur_idx -= 1
+        self._cur = self._rebuild(self._cur_idx)
+        return self._cur
+
+    def redo(self) -> typing.Optional[level.State]:
+        """returns: the next state, or None if there isn't one."""
+        if not self.can_redo():
+            return None
+        res = self._cur.copy()
+        self._deltas[self._cur_idx - self._first_idx].apply(res)
+        self._cur_idx += 1
+        self._cur = res
+        return res
+
+    def _rebuild(self, idx) -> level.State:
+        key_idx = idx - (idx % self.keyframe_interval)
+        if key_idx < self._first_idx:
+            key_idx = self._first_idx
+        res = self._keyframes[key_idx].copy()
+        for i in range(key_idx, idx):
+            self._deltas[i - self._first_idx].apply(res)
+        return res
+
+    def _add_keyframe(self, idx, state):
+        self._keyframes[idx] = state.copy()
+        self._num_bytes += _keyframe_bytes(state)
+
+    def _remove_keyframe(self, idx):
+        self._num_bytes -= _keyframe_bytes(self._keyframes.pop(idx))
+
+    def _truncate(self, idx):
+        for i in range(idx - self._first_idx, len(self._deltas)):
+            self._num_bytes -= self._deltas[i].num_bytes()
+        del self._deltas[idx - self._first_idx:]
+        for key_idx in [k for k in self._keyframes if k > idx]:
+            self._remove_keyframe(key_idx)
+
+    def _drop_old_history(self):
+        if self.max_bytes is None:
+            return
+        while self._num_bytes > self.max_bytes:
+            next_key_idx = self._first_idx - (self._first_idx % self.keyframe_interval) + self.keyframe_interval
+            if next_key_idx > self._cur_idx or next_key_idx not in self._keyframes:
+                return  # the current state's own segment is never dropped
+            for d in self._deltas[:next_key_idx - self._first_idx]:
+                self._num_bytes -= d.num_bytes()
+            del self._deltas[:next_key_idx - self._first_idx]
+            self._remove_keyframe(self._first_idx)
+            self._first_idx = next_key_idx
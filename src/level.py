@@ -1,3 +1,5 @@
+import collections
+import hashlib
 import json
 import os.path
 import traceback
@@ -23,6 +25,34 @@ def next_uid() -> int:
     return _UID_COUNTER - 1
 
 
+_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+_ZOBRIST_KEYS = {}  # (ent_id, color_id, direction, xy) -> random 64-bit int
+
+
+def _hash_key(ent, xy):
+    # only enemies' directions affect the rules (the player's is overwritten before it's read)
+    direction = ent.direction if ent.ent_id in sprites.EntityID.all_enemies() else None
+    return ent.ent_id, ent.color_id, direction, xy
+
+
+def _zobrist_key(ent, xy) -> int:
+    key = _hash_key(ent, xy)
+    if key not in _ZOBRIST_KEYS:
+        # derived from the key itself (rather than an RNG) so it's the same across processes
+        digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+        _ZOBRIST_KEYS[key] = int.from_bytes(digest, "little")
+    return _ZOBRIST_KEYS[key]
+
+
+_DIRECTIONS = {}  # canonical instances of direction tuples, so entities don't each hold their own copies
+
+
+def _intern_direction(xy):
+    if xy not in _DIRECTIONS:
+        _DIRECTIONS[xy] = tuple(xy)
+    return _DIRECTIONS[xy]
+
+
 def get_anim_idx():
     anim_speed = 4
     return int(inputs.get_time() * anim_speed)
@@ -31,6 +61,8 @@ def get_anim_idx():
 @total_ordering
 class Entity:
 
+    __slots__ = ('uid', 'ent_id', 'color_id', 'direction', 'art_direction')
+
     def __init__(self, ent_id: str, color_id: int, direction=(0, 1), art_direction=(1, 1), uid=None):
         self.uid = uid or next_uid()
         self.ent_id = ent_id
@@ -58,8 +90,8 @@ class Entity:
             art_dir[0] = xy[0]
         if xy[1] != 0:
             art_dir[1] = xy[1]
-        self.art_direction = tuple(art_dir)
-        self.direction = xy
+        self.art_direction = _intern_direction(tuple(art_dir))
+        self.direction = _intern_direction(xy)
 
     def copy(self, dest=None) -> 'Entity':
         if dest is None:
@@ -84,12 +116,18 @@ class Entity:
     def is_wall(self):
         return isinstance(self, Wall)
 
+    def is_static(self):
+        """Whether this entity can never move or change (so it can be shared between states)."""
+        return False
+
     def is_box(self):
         return isinstance(self, Box)
 
 
 class Box(Entity):
 
+    __slots__ = ()
+
     def __init__(self, color_id=colors.BROWN_ID, uid=None):
         super().__init__(sprites.EntityID.BOX, color_id=color_id, uid=uid)
 
@@ -105,6 +143,8 @@ class Box(Entity):
 
 class Wall(Entity):
 
+    __slots__ = ()
+
     def __init__(self, color_id=colors.WHITE_ID, uid=None):
         super().__init__(sprites.EntityID.WALL, color_id=color_id, uid=uid)
 
@@ -114,12 +154,17 @@ class Wall(Entity):
     def is_solid(self):
         return True
 
+    def is_static(self):
+        return True
+
     def is_pushable(self):
         return False
 
 
 class Player(Entity):
 
+    __slots__ = ()
+
     def __init__(self, color_id: int, uid=None):
         super().__init__(sprites.EntityID.PLAYER, color_id, uid=uid)
 
@@ -138,6 +183,8 @@ class Player(Entity):
 
 class Enemy(Entity):
 
+    __slots__ = ()
+
     def __init__(self, color_id: int, direction, uid=None):
         if direction == (0, 0):
             ent_id = sprites.EntityID.NO_WALKER
@@ -168,6 +215,8 @@ class Enemy(Entity):
 
 class Snek(Entity):
 
+    __slots__ = ()
+
     def __init__(self, color_id=colors.YELLOW_ID, uid=None):
         super().__init__(sprites.EntityID.SNEK, color_id=color_id, uid=uid)
 
@@ -186,6 +235,8 @@ class Snek(Entity):
 
 class Potion(Entity):
 
+    __slots__ = ()
+
     def __init__(self, color_id=colors.PINK_ID, uid=None):
         super().__init__(sprites.EntityID.POTION, color_id=color_id, uid=uid)
 
@@ -264,32 +315,93 @@ class State:
         self.level: typing.Dict[typing.Tuple[int, int], typing.List[Entity]] = {}
         self.bounds = bounds
 
+        # static entities (i.e. walls) are kept in a separate layer that's shared between copies of the state,
+        # and copied on write (which only happens in the editor).
+        self.terrain: typing.Dict[typing.Tuple[int, int], typing.Tuple[Entity, ...]] = {}
+        self._owns_terrain = True
+        self.terrain_version = 0  # incremented whenever the terrain is modified (so caches of it know to update)
+
+        # uid -> (x, y) of every entity, so they can be found without searching (the terrain's index is shared
+        # along with the terrain).
+        self._positions: typing.Dict[int, typing.Tuple[int, int]] = {}
+        self._terrain_positions: typing.Dict[int, typing.Tuple[int, int]] = {}
+
+        # ent_id -> uid -> entity, so entities of a given type can be found without searching.
+        self._by_type: typing.Dict[str, typing.Dict[int, Entity]] = {}
+        self._terrain_by_type: typing.Dict[str, typing.Dict[int, Entity]] = {}
+
         self.what_was = WhatHappened()  # note: not copied
         self.original_filepath = None  # note: also not copied
 
+        # zobrist-style hash of the board, kept up to date incrementally. Entities' keys are summed (rather than
+        # xor'd) so that stacks of identical entities don't cancel out. Note that step and uids aren't included.
+        self._hash = 0
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif not isinstance(other, State) or self._hash != other._hash:
+            return False
+        else:
+            return self._board_contents() == other._board_contents()
+
+    def __hash__(self):
+        return self._hash
+
+    def _board_contents(self):
+        return collections.Counter(_hash_key(e, xy) for e, xy in self.all_entity_positions())
+
     def copy(self) -> 'State':
         res = State(self.name, step=self.step, prev=self.prev)
         res.bounds = None if self.bounds is None else tuple(self.bounds)
 
-        for xy in self.level:
-            for e in self.level[xy]:
-                res.add_entity(xy, e.copy(), ignore_bounds=True)
+        res.terrain = self.terrain
+        res._terrain_positions = self._terrain_positions
+        res._terrain_by_type = self._terrain_by_type
+        res._owns_terrain = self._owns_terrain = False
+        res.terrain_version = self.terrain_version
+
+        for xy, ents in self.level.items():
+            ents_copy = [e.copy() for e in ents]
+            res.level[xy] = ents_copy
+            for e in ents_copy:
+                if e.ent_id not in res._by_type:
+                    res._by_type[e.ent_id] = {}
+                res._by_type[e.ent_id][e.uid] = e
+        res._positions = dict(self._positions)
+        res._hash = self._hash
         return res
 
+    def _get_terrain_for_writing(self):
+        if not self._owns_terrain:
+            self.terrain = dict(self.terrain)
+            self._terrain_positions = dict(self._terrain_positions)
+            self._terrain_by_type = {ent_id: dict(ents) for ent_id, ents in self._terrain_by_type.items()}
+            self._owns_terrain = True
+        self.terrain_version += 1
+        return self.terrain
+
+    def all_cells(self):
+        """yields: every (x, y) that contains at least one entity."""
+        for xy in self.terrain:
+            yield xy
+        for xy in self.level:
+            if xy not in self.terrain:
+                yield xy
+
     def get_area(self, cache=False):
-        if self.bounds is None and cache and not len(self.level) == 0:
-            self.bounds = utils.get_rect_containing_points(self.level.keys())
+        if self.bounds is None and cache and not (len(self.level) == 0 and len(self.terrain) == 0):
+            self.bounds = utils.get_rect_containing_points(list(self.all_cells()))
 
         if self.bounds is not None:
             return self.bounds
         else:
-            return utils.get_rect_containing_points(self.level.keys())
+            return utils.get_rect_containing_points(list(self.all_cells()))
 
     def get_xy(self, ent):
-        # TODO this is real bad
-        for xy in self.all_entity_positions(cond=lambda _e: _e == ent):
-            return xy
-        return None
+        if ent.uid in self._positions:
+            return self._positions[ent.uid]
+        return self._terrain_positions.get(ent.uid)
 
     def is_in_bounds(self, xy):
         return self.bounds is None or utils.rect_contains(self.bounds, xy)
@@ -297,25 +409,61 @@ class State:
     def add_entity(self, xy, ent, ignore_bounds=False):
         if not ignore_bounds and not self.is_in_bounds(xy):
             raise ValueError(f"tried to add {ent} out of bounds: {xy}")
-        if xy not in self.level:
-            self.level[xy] = []
-        self.level[xy].append(ent)
+        if ent.is_static():
+            terrain = self._get_terrain_for_writing()
+            terrain[xy] = terrain.get(xy, ()) + (ent,)
+            self._terrain_positions[ent.uid] = xy
+            by_type = self._terrain_by_type
+        else:
+            if xy not in self.level:
+                self.level[xy] = []
+            self.level[xy].append(ent)
+            self._positions[ent.uid] = xy
+            by_type = self._by_type
+        if ent.ent_id not in by_type:
+            by_type[ent.ent_id] = {}
+        by_type[ent.ent_id][ent.uid] = ent
+        self._hash = (self._hash + _zobrist_key(ent, xy)) & _HASH_MASK
 
     def remove_entity(self, xy, ent, or_else='fail'):
-        if xy is None or xy not in self.level or ent not in self.level[xy]:
+        if ent.is_static():
+            return self._remove_static_entity(xy, ent, or_else=or_else)
+        actual_xy = self._positions.get(ent.uid)
+        if actual_xy is None or actual_xy != xy:
             if or_else == 'fail':
                 raise ValueError(f"{ent} is not at {xy}, cannot remove it")
-            elif or_else == 'search':
-                actual_xy = self.get_xy(ent)
-                if actual_xy is not None:
-                    return self.remove_entity(actual_xy, ent, or_else='fail')
+            elif or_else == 'search' and actual_xy is not None:
+                return self.remove_entity(actual_xy, ent, or_else='fail')
         else:
             self.level[xy].remove(ent)
             if len(self.level[xy]) == 0:
                 del self.level[xy]
+            del self._positions[ent.uid]
+            del self._by_type[ent.ent_id][ent.uid]
+            self._hash = (self._hash - _zobrist_key(ent, xy)) & _HASH_MASK
             return True
         return False
 
+    def _remove_static_entity(self, xy, ent, or_else='fail'):
+        actual_xy = self._terrain_positions.get(ent.uid)
+        if actual_xy is None or actual_xy != xy:
+            if or_else == 'fail':
+                raise ValueError(f"{ent} is not at {xy}, cannot remove it")
+            elif or_else == 'search' and actual_xy is not None:
+                return self._remove_static_entity(actual_xy, ent, or_else='fail')
+            return False
+        else:
+            terrain = self._get_terrain_for_writing()
+            remaining = tuple(e for e in terrain[xy] if e != ent)
+            if len(remaining) == 0:
+                del terrain[xy]
+            else:
+                terrain[xy] = remaining
+            del self._terrain_positions[ent.uid]
+            del self._terrain_by_type[ent.ent_id][ent.uid]
+            self._hash = (self._hash - _zobrist_key(ent, xy)) & _HASH_MASK
+            return True
+
     def remove_all_entities_at(self, xy):
         for ent in list(self.all_entities_at(xy)):
             self.remove_entity(xy, ent)
@@ -326,7 +474,28 @@ class State:
             self.add_entity(to_xy, entity, ignore_bounds=ignore_bounds)
             self.what_was.moved.add(entity)
 
+    def set_entity_color(self, xy, ent, color_id):
+        if ent.color_id != color_id:
+            if ent.is_static():
+                # it may be shared with other states, so it's replaced rather than modified
+                self.remove_entity(xy, ent)
+                new_ent = ent.copy()
+                new_ent.color_id = color_id
+                self.add_entity(xy, new_ent, ignore_bounds=True)
+                return
+            self._hash = (self._hash - _zobrist_key(ent, xy)) & _HASH_MASK
+            ent.color_id = color_id
+            self._hash = (self._hash + _zobrist_key(ent, xy)) & _HASH_MASK
+
+    def set_entity_direction(self, xy, ent, direction):
+        self._hash = (self._hash - _zobrist_key(ent, xy)) & _HASH_MASK
+        ent.set_direction(direction)
+        self._hash = (self._hash + _zobrist_key(ent, xy)) & _HASH_MASK
+
     def all_entities_at(self, xy):
+        if xy in self.terrain:
+            for e in self.terrain[xy]:
+                yield e
         if xy in self.level:
             for e in self.level[xy]:
                 yield e
@@ -334,15 +503,24 @@ class State:
     def all_entities_with_type(self, ent_ids):
         if isinstance(ent_ids, str):
             ent_ids = (ent_ids,)
-        for xy in self.level:
-            for e in self.all_entities_at(xy):
-                if e.ent_id in ent_ids:
-                    yield e, xy
+        for ent_id in ent_ids:
+            if ent_id in self._by_type:
+                for uid, e in self._by_type[ent_id].items():
+                    yield e, self._positions[uid]
+            if ent_id in self._terrain_by_type:
+                for uid, e in self._terrain_by_type[ent_id].items():
+                    yield e, self._terrain_positions[uid]
+
+    def num_entities_with_type(self, ent_ids):
+        if isinstance(ent_ids, str):
+            ent_ids = (ent_ids,)
+        res = 0
+        for ent_id in ent_ids:
+            res += len(self._by_type.get(ent_id, ())) + len(self._terrain_by_type.get(ent_id, ()))
+        return res
 
     def is_player_alive(self):
-        for _ in self.all_entities_with_type(sprites.EntityID.PLAYER):
-            return True
-        return False
+        return self.num_entities_with_type(sprites.EntityID.PLAYER) > 0
 
     def get_player_color(self):
         for p, _ in self.all_entities_with_type(sprites.EntityID.PLAYER):
@@ -350,10 +528,7 @@ class State:
         return colors.WHITE_ID
 
     def num_enemies_remaining(self):
-        res = 0
-        for _ in self.all_entities_with_type(sprites.EntityID.all_enemies()):
-            res += 1
-        return res
+        return self.num_entities_with_type(sprites.EntityID.all_enemies())
 
     def get_initial_state(self):
         cur = self
@@ -365,15 +540,17 @@ class State:
         return self.num_enemies_remaining() == 0
 
     def all_coords_with_type(self, ent_ids):
-        if isinstance(ent_ids, str):
-            ent_ids = (ent_ids,)
-        for xy in self.level:
-            for e in self.all_entities_at(xy):
-                if e.ent_id in ent_ids:
-                    yield xy
+        for _, xy in self.all_entities_with_type(ent_ids):
+            yield xy
+
+    def all_dynamic_entity_positions(self):
+        """yields: (entity, (x, y)) for every entity that isn't part of the terrain, grouped by cell."""
+        for xy, ents in self.level.items():
+            for e in ents:
+                yield e, xy
 
     def all_entity_positions(self, cond=None):
-        for xy in self.level:
+        for xy in self.all_cells():
             for e in self.all_entities_at(xy):
                 if cond is None or cond(e):
                     yield e, xy
@@ -439,9 +616,9 @@ class State:
                         self.move_entity(xy, dest_xy, p)
                         success = True
 
-        for p, _ in self.all_entities_with_type(sprites.EntityID.PLAYER):
+        for p, xy in list(self.all_entities_with_type(sprites.EntityID.PLAYER)):
             if p.direction != player_dir:
-                p.set_direction(player_dir)
+                self.set_entity_direction(xy, p, player_dir)
                 self.what_was.turned.add(p)
 
         return success
@@ -479,13 +656,13 @@ class State:
                 any_pot_had_orig_color = False
                 for pot in potions:
                     if e.color_id != pot.color_id:
-                        e.color_id = pot.color_id
+                        self.set_entity_color(xy, e, pot.color_id)
                         self.what_was.colored.add(e)
                         used_any_potion = True
                     if pot.color_id == orig_color:
                         any_pot_had_orig_color = True
                 if e.color_id != orig_color and any_pot_had_orig_color:
-                    e.color_id = orig_color  # trust me, this is logical
+                    self.set_entity_color(xy, e, orig_color)  # trust me, this is logical
 
             # if any potion got used, remove all potions (again, logical)
             if used_any_potion:
@@ -509,7 +686,7 @@ class State:
             if self.is_solid(dest_xy, for_color_id=e.color_id):
                 e_dir = utils.sub((0, 0), e_dir)
                 if e.direction != e_dir:
-                    e.set_direction(e_dir)
+                    self.set_entity_direction(xy, e, e_dir)
                     self.what_was.turned.add(e)
 
     def _move_enemies(self):
@@ -575,8 +752,8 @@ class State:
         return self.prev
 
     def render_level(self, surf: pygame.Surface, pos, cellsize=32):
-        for xy in self.level:
-            for ent in self.level[xy]:
+        for xy in self.all_cells():
+            for ent in self.all_entities_at(xy):
                 ent_sprite = ent.get_sprite(cellsize)
                 ent_xy = (pos[0] + cellsize * xy[0],
                           pos[1] + cellsize * xy[1])
@@ -1,12 +1,14 @@
 import os
 import json
 import string
+import typing
 
 import configs
 import src.level as level
 import src.colors as colors
 import src.utils as utils
 import src.userdata as userdata
+import src.sprites as sprites
 
 
 _ORDERED_LEVELS_FROM_DISK = []
@@ -17,6 +19,7 @@ EASTER_EGG_LEVEL = None
 SAW_SNEK_LORE = False
 
 LEVEL_COMPLETIONS_KEY = "completed_levels"
+BEST_REPLAYS_KEY = "best_replays"
 
 
 def load_levels():
@@ -73,6 +76,36 @@ def all_levels():
         yield l
 
 
+def get_sprite_keys(cell_size) -> typing.List[tuple]:
+    """returns: the keys (see sprites.get_sprite) of every sprite the levels can show at the given cell size, in the
+    order the levels are played."""
+    movers = (sprites.EntityID.PLAYER, sprites.EntityID.SNEK) + sprites.EntityID.all_enemies()
+    art_directions = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+    res = []
+    levels = list(all_levels()) + ([EASTER_EGG_LEVEL] if EASTER_EGG_LEVEL is not None else [])
+    for lvl in levels:
+        ents = [e for e, _ in lvl.all_entity_positions()]
+
+        # players and enemies can take the color of any potion in the level, and face any way
+        mover_colors = sorted(set(e.color_id for e in ents
+                                  if e.ent_id in movers or e.ent_id == sprites.EntityID.POTION))
+        for e in ents:
+            n_frames = sprites.get_num_frames(e.ent_id)
+            if e.ent_id in movers:
+                for color_id in mover_colors:
+                    for art_dir in art_directions:
+                        res.extend((e.ent_id, cell_size, color_id, art_dir, i) for i in range(n_frames))
+            else:
+                res.extend((e.ent_id, cell_size, e.color_id, e.art_direction, i) for i in range(n_frames))
+
+        # anything that moves can die
+        n_frames = sprites.get_num_frames(sprites.EntityID.EXPLOSION)
+        for color_id in mover_colors:
+            res.extend((sprites.EntityID.EXPLOSION, cell_size, color_id, (0, 1), i) for i in range(n_frames))
+
+    return list(dict.fromkeys(res))
+
+
 def is_completed(name) -> int:
     to_str_int_dict = utils.get_dict_type_coercer(str, int)
     completed_levels = userdata.get_data(LEVEL_COMPLETIONS_KEY, coercer=to_str_int_dict, or_else={})
@@ -82,14 +115,25 @@ def is_completed(name) -> int:
         return 0
 
 
-def set_completed(name, steps):
+def set_completed(name, steps, replay=None):
     to_str_int_dict = utils.get_dict_type_coercer(str, int)
     completed_levels = userdata.get_data(LEVEL_COMPLETIONS_KEY, coercer=to_str_int_dict, or_else={})
     if name not in completed_levels or completed_levels[name] > steps:
         completed_levels[name] = steps
+        if replay is not None:
+            to_str_str_dict = utils.get_dict_type_coercer(str, str)
+            best_replays = userdata.get_data(BEST_REPLAYS_KEY, coercer=to_str_str_dict, or_else={})
+            best_replays[name] = replay
+            userdata.set_data(BEST_REPLAYS_KEY, best_replays, and_save_to_disk=False)
         userdata.set_data(LEVEL_COMPLETIONS_KEY, completed_levels)
 
 
+def get_best_replay(name) -> typing.Optional[str]:
+    """returns: the moves of the best solution to the level (see src.replays), if one was saved."""
+    to_str_str_dict = utils.get_dict_type_coercer(str, str)
+    return userdata.get_data(BEST_REPLAYS_KEY, coercer=to_str_str_dict, or_else={}).get(name)
+
+
 def is_every_level_complete():
     for l in all_levels():
         if not is_completed(l.name):
@@ -138,34 +182,37 @@ def make_demo_state():
     return state
 
 
-def make_demo_state2(dims=(13, 7)):
-    import random
+def make_demo_state2(dims=(13, 7), rng=None):
+    """Makes a random level, using the given random.Random (or the global one, if None)."""
+    if rng is None:
+        import random
+        rng = random
 
-    name = "".join(random.choice(string.ascii_lowercase) for _2 in range(6))
+    name = "".join(rng.choice(string.ascii_lowercase) for _2 in range(6))
     state = level.State(name)
 
     for x in range(dims[0]):
         for y in range(dims[1]):
             xy = (x, y)
-            if x == 0 or y == 0 or x == dims[0] - 1 or y == dims[1] - 1 or random.random() < 0.2:
-                if random.random() < 0.1:
-                    wall_color_id = colors.rand_color_id()
+            if x == 0 or y == 0 or x == dims[0] - 1 or y == dims[1] - 1 or rng.random() < 0.2:
+                if rng.random() < 0.1:
+                    wall_color_id = colors.rand_color_id(rng=rng)
                 else:
                     wall_color_id = colors.WHITE_ID
                 state.add_entity(xy, level.Wall(color_id=wall_color_id))
-            elif random.random() < 0.2:
-                if random.random() < 0.8:
-                    box_color_id = random.randint(0, colors.YELLOW_ID)
+            elif rng.random() < 0.2:
+                if rng.random() < 0.8:
+                    box_color_id = rng.randint(0, colors.YELLOW_ID)
                 else:
                     box_color_id = colors.BROWN_ID
                 state.add_entity(xy, level.Box(color_id=box_color_id))
-            elif random.random() <= 0.1:
-                state.add_entity(xy, level.Potion(random.randint(0, colors.YELLOW_ID)))
-            elif random.random() <= 0.1:
-                direction = random.choice([(-1, 0), (1, 0), (0, 1), (0, -1), (0, 0)])
-                state.add_entity(xy, level.Enemy(random.randint(0, colors.YELLOW_ID), direction))
+            elif rng.random() <= 0.1:
+                state.add_entity(xy, level.Potion(rng.randint(0, colors.YELLOW_ID)))
+            elif rng.random() <= 0.1:
+                direction = rng.choice([(-1, 0), (1, 0), (0, 1), (0, -1), (0, 0)])
+                state.add_entity(xy, level.Enemy(rng.randint(0, colors.YELLOW_ID), direction))
 
-    p_xy = random.randint(1, dims[0] - 2), random.randint(1, dims[1] - 2)
+    p_xy = rng.randint(1, dims[0] - 2), rng.randint(1, dims[1] - 2)
     for e in list(state.all_entities_at(p_xy)):
         state.remove_entity(p_xy, e)
     state.add_entity(p_xy, level.Player(colors.RED_ID))
@@ -12,8 +12,13 @@ import src.sounds as sounds
 import src.sprites as sprites
 
 import src.level as level
+import src.history as history
+import src.hints as hints
+import src.transitions as transitions
 import src.loader as loader
 import src.rendering as rendering
+import src.replays as replays
+import src.solutions as solutions
 import src.textrendering as tr
 
 
@@ -27,6 +32,12 @@ class Menu:
     def draw(self, screen):
         pass
 
+    def get_dirty_rects(self, screen) -> typing.Optional[typing.List]:
+        """returns: the areas of the screen that'll look different when the menu is drawn this frame (compared to
+            the last frame), or None if all of it might (which is the default).
+        """
+        return None
+
     def fill_bg(self, screen):
         if self.bg_color is not None:
             screen.fill(self.bg_color)
@@ -34,6 +45,10 @@ class Menu:
     def update(self, dt):
         pass
 
+    def background_update(self, time_budget):
+        """Does work that can happen in the spare time at the end of a frame (for up to time_budget seconds)."""
+        pass
+
 
 class MenuManager:
 
@@ -43,6 +58,8 @@ class MenuManager:
 
         self.next_menu: typing.Optional[Menu] = None
 
+        self._last_drawn = (None, None, None)  # (menu, screen size, sprite cache generation)
+
     def get_menu(self) -> Menu:
         return self.cur_menu
 
@@ -79,9 +96,35 @@ class MenuManager:
         self.cur_menu.update(dt)
         self.cur_menu.elapsed_time += dt
 
-    def draw(self, screen):
-        self.cur_menu.fill_bg(screen)
-        self.cur_menu.draw(screen)
+    def background_update(self, time_budget):
+        self.cur_menu.background_update(time_budget)
+
+    def force_full_redraw(self):
+        self._last_drawn = (None, None, None)
+
+    def draw(self, screen) -> typing.Optional[typing.List]:
+        """Draws the current menu, skipping the parts of the screen that haven't changed since the last frame.
+        returns: the areas of the screen that were redrawn, or None if the whole screen was.
+        """
+        menu = self.cur_menu
+        cur_drawn = (menu, screen.get_size(), sprites.get_cache_generation())
+        if self._last_drawn != cur_drawn:
+            dirty_rects = None  # it's a new menu (or the window was resized, or the colors changed)
+        else:
+            dirty_rects = menu.get_dirty_rects(screen)
+        self._last_drawn = cur_drawn
+
+        if dirty_rects is None:
+            menu.fill_bg(screen)
+            menu.draw(screen)
+        elif len(dirty_rects) > 0:
+            # the menu's redrawn as usual, but only the dirty parts of the screen are touched
+            old_clip = screen.get_clip()
+            screen.set_clip(pygame.Rect(dirty_rects[0]).unionall(dirty_rects[1:]))
+            menu.fill_bg(screen)
+            menu.draw(screen)
+            screen.set_clip(old_clip)
+        return dirty_rects
 
 
 class MainMenu(Menu):
@@ -102,6 +145,22 @@ class MainMenu(Menu):
 
         self.p_color_id = colors.rand_color_id()
         self.e_color_id = colors.rand_color_id()
+        self._drawn_key = None
+
+    @staticmethod
+    def get_sprite_keys():
+        """returns: the keys (see sprites.get_sprite) of the big sprites this menu can show."""
+        res = []
+        for color_id in range(colors.RED_ID, colors.YELLOW_ID + 1):
+            res.append((sprites.EntityID.BIG_PLAYER, 64 * 3, color_id, (0, 1), 0))
+            res.append((sprites.EntityID.BIG_V_WALKER, 64 * 3, color_id, (-1, 0), 0))
+        return res
+
+    def _get_draw_key(self):
+        return self._selected_opt, self.p_color_id, self.e_color_id
+
+    def get_dirty_rects(self, screen):
+        return [] if self._get_draw_key() == self._drawn_key else None
 
     def _activate_option(self, idx=None):
         if idx is None:
@@ -165,6 +224,7 @@ class MainMenu(Menu):
                 opt.set_color(colors.get_white())
 
     def draw(self, screen: pygame.Surface):
+        self._drawn_key = self._get_draw_key()
         cx = screen.get_width() // 2
         title_cy = screen.get_height() // 4
 
@@ -203,6 +263,9 @@ class CutSceneMenu(Menu):
             sounds.play(sounds.PLAYER_MOVED)
             self.manager.set_menu(CutSceneMenu(self.pages, self.next, idx=next_idx), transition=True)
 
+    def get_dirty_rects(self, screen):
+        return []  # each page is a separate menu, so nothing changes once it's been drawn
+
     def draw(self, screen):
         if 0 <= self.cur_idx < len(self.pages):
             page = self.pages[self.cur_idx]
@@ -218,6 +281,7 @@ class InstructionsMenu(CutSceneMenu):
                                  "[WASD] or arrow keys to Move\n"
                                  "[R] to Reset Level\n"
                                  "[Z] to Undo\n"
+                                 "[H] for a Hint\n"
                                  "[M] to Mute music\n\n"
                                  "Walk into walls to skip turn", "M", alignment=0, y_kerning=2)]
         super().__init__(pages, next_menu)
@@ -442,6 +506,8 @@ class LevelSelectMenu(Menu):
         self.cell_rects = []
         self.cell_text = []
 
+        self._drawn_key = None
+
     def _update_selected_level_text(self):
         sel_name = self.get_selected().name
         if sel_name in self.completed_names:
@@ -450,6 +516,10 @@ class LevelSelectMenu(Menu):
             status = "Incomplete"
         else:
             status = "Locked"
+        best = solutions.get_best_steps(self.get_selected()) if self.is_unlocked(sel_name) else None
+        if best is not None:
+            # levels that are too hard to solve optimally only have the best solution that's been found
+            status += f" (Par: {best[0]})" if best[1] else f" (Best Known: {best[0]})"
         self.selected_level_text.set_text(f"{sel_name}: {status}")
 
     def get_selected(self) -> level.State:
@@ -462,7 +532,14 @@ class LevelSelectMenu(Menu):
             name_idx = loader.idx_of(name)
             return name_idx <= self.max_completed_idx + 1
 
+    def _get_draw_key(self):
+        return self.selected_idx, self.selected_level_text.get_text()
+
+    def get_dirty_rects(self, screen):
+        return [] if self._get_draw_key() == self._drawn_key else None
+
     def draw(self, screen):
+        self._drawn_key = self._get_draw_key()
         cx = screen.get_width() // 2
         y = screen.get_height() // 4
         spacing = 16
@@ -630,10 +707,16 @@ class PlayingLevelMenu(Menu):
         super().__init__()
         self.initial_state = initial_state
         self.state = self.initial_state.copy()
-        self.renderer = rendering.AnimatedLevelRenderer(self.state, cell_size=48)
+        self.history = history.History(self.state, max_bytes=configs.UNDO_HISTORY_MAX_BYTES)
+        self.transitions = transitions.TransitionCache(max_size=configs.TRANSITION_CACHE_SIZE)
+        self.renderer = rendering.AnimatedLevelRenderer(self.state, cell_size=configs.CELL_SIZE)
+        self.renderer.initial_state = self.initial_state
+        self.hints: typing.Optional[hints.HintEngine] = None  # created the first time a hint is asked for
 
     def do_reset(self, silent=False):
         self.state = self.initial_state.copy()
+        self.history = history.History(self.state, max_bytes=configs.UNDO_HISTORY_MAX_BYTES)
+        self.renderer.initial_state = self.initial_state
         self.renderer.set_state(self.state, prev=None)
         if not silent:
             sounds.play(sounds.LEVEL_RESET)
@@ -645,11 +728,17 @@ class PlayingLevelMenu(Menu):
                 self.initial_state = loader.make_demo_state2()
             self.do_reset()
         elif inputs.was_pressed(configs.UNDO):
-            prev = self.state.get_prev()
+            prev = self.history.undo()
             if prev is not None:
-                self.state = prev.copy()  # probably don't *need* to copy here, but eh
+                self.state = prev
                 self.renderer.set_state(self.state, prev=old_state)
             sounds.play(sounds.UNDO_LEVEL)
+        elif inputs.was_pressed(configs.REDO):
+            nxt = self.history.redo()
+            if nxt is not None:
+                self.state = nxt
+                self.renderer.set_state(self.state, prev=old_state)
+                sounds.play(sounds.PLAYER_MOVED)
         elif inputs.was_pressed(configs.ALL_MOVE_KEYS):
             if inputs.was_pressed(configs.MOVE_LEFT):
                 direction = (-1, 0)
@@ -661,10 +750,18 @@ class PlayingLevelMenu(Menu):
                 direction = (0, 1)
             else:
                 direction = (0, 0)
-            self.state = old_state.get_next(direction)
+            self.state = self.transitions.get_next(old_state, direction)
+            self.history.push(self.state, move=direction)
             self.renderer.set_state(self.state, prev=old_state)
             self.state.what_was.play_sounds()
             print(f"step={self.state.step}:\t{self.state.what_was}")
+        elif inputs.was_pressed(configs.HINT):
+            if self.hints is None:
+                self.hints = hints.HintEngine(self.initial_state, use_process=not configs.WEB_MODE,
+                                              max_states=configs.HINT_MAX_STATES)
+                self.hints.set_state(self.state)
+            else:
+                self._close_hints()
 
         # level editing stuff
         if configs.IS_DEBUG:
@@ -717,23 +814,31 @@ class PlayingLevelMenu(Menu):
                 self.do_reset(silent=True)
             for k in range(pygame.K_1, pygame.K_7 + 1):
                 if mouse_xy is not None and inputs.was_pressed(k):
-                    for ent in self.initial_state.all_entities_at(mouse_xy):
-                        ent.color_id = k - pygame.K_1
+                    for ent in list(self.initial_state.all_entities_at(mouse_xy)):
+                        self.initial_state.set_entity_color(mouse_xy, ent, k - pygame.K_1)
                     self.do_reset(silent=True)
 
             if inputs.was_pressed(pygame.K_EQUALS):  # win button
                 self.state = self.state.get_next((0, 0))
                 for e, xy in list(self.state.all_entities_with_type(sprites.EntityID.all_enemies())):
                     self.state.remove_entity(xy, e)
+                self.history.push(self.state)
+
+        if self.hints is not None:
+            self.hints.set_state(self.state)
 
         if inputs.was_pressed(configs.ESCAPE):
+            self._close_hints()
             self.manager.set_menu(LevelSelectMenu(selected_name=self.state.name), transition=True)
             sounds.play(sounds.LEVEL_QUIT)
 
-        elif self.state != old_state:
+        elif self.state is not old_state:
             if self.state.step > 0 and self.state.is_success():
-                loader.set_completed(self.state.name, self.state.step)
+                moves = self.history.get_moves()
+                replay = replays.encode(moves) if moves is not None else None
+                loader.set_completed(self.state.name, self.state.step, replay=replay)
                 idx = loader.idx_of(self.state.name)
+                self._close_hints()
 
                 if configs.IS_DEBUG and configs.DEBUG_NO_CONTINUE:
                     print("INFO: Resetting because we're in dev")
@@ -763,8 +868,28 @@ class PlayingLevelMenu(Menu):
             elif self._show_snek_lore_if_necessary():
                 pass
 
-    def draw(self, screen):
+    def background_update(self, time_budget):
+        if self.hints is not None:
+            self.hints.update(time_budget)
+
+    def _close_hints(self):
+        if self.hints is not None:
+            self.hints.close()
+            self.hints = None
+
+    def _prepare_renderer(self, screen):
         self.renderer.get_offset_for_centering(screen, and_apply=True)
+        if self.hints is not None:
+            self.renderer.set_hint(self.hints.get_status(), self.hints.get_hint())
+        else:
+            self.renderer.set_hint(None, None)
+
+    def get_dirty_rects(self, screen):
+        self._prepare_renderer(screen)
+        return self.renderer.get_dirty_rects(screen)
+
+    def draw(self, screen):
+        self._prepare_renderer(screen)
         self.renderer.update()
         self.renderer.draw(screen)
 
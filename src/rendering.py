@@ -1,9 +1,12 @@
+import itertools
 import typing
 import math
 
 import pygame
 
 import src.level as level
+import src.deadlocks as deadlocks
+import src.hints as hints
 import src.inputs as inputs
 import src.utils as utils
 import src.sprites as sprites
@@ -17,6 +20,7 @@ class LevelRenderer:
         self.cur_state: level.State = state
         self.prev_state: typing.Optional[level.State] = None
         self.prev_state_time = 0
+        self.initial_state: typing.Optional[level.State] = None  # if None, it's found through State.prev
 
         self.centered = True
         self.xy_offset = (0, 0)
@@ -27,20 +31,38 @@ class LevelRenderer:
         self.success_text = None
 
         self.goal_text = None
+        self.stuck_text = None
         self.dimension_text = None
         self.in_progress_text = None
         self.controls_text = None
+        self.hint_text = None
+
+        self.hint_status = None  # a hints status, or None if hints aren't being shown
+        self.hint_move = None  # the move that's being hinted at, if it's known
+
+        self._stuck_cache = (None, None, False)  # (state, its hash, whether it's deadlocked)
+
+        # the terrain (i.e. the walls) never changes while a level is being played, so it's pre-rendered into one
+        # surface: (terrain, (terrain version, cell size, sprite cache generation), top-left cell, surface or None)
+        self._terrain_layer = None
+
+        # what the play area, top bar and info area looked like when they were last drawn (see get_dirty_rects)
+        self._drawn_keys = None
 
     def set_state(self, state, prev='current'):
         if prev == 'current':
             self.prev_state = self.cur_state
-        elif state == prev:
+        elif state is prev:
             return
         else:
             self.prev_state = prev
         self.cur_state = state
         self.prev_state_time = inputs.get_time()
 
+    def set_hint(self, status, move):
+        self.hint_status = status
+        self.hint_move = move
+
     def set_offset(self, offs_xy):
         if offs_xy is not None:
             self.xy_offset = offs_xy
@@ -63,10 +85,45 @@ class LevelRenderer:
         pass
 
     def all_sorted_entities_to_render(self):
+        """yields: (entity or Surface, (x, y)) for everything that isn't part of the terrain layer."""
         if self.cur_state is not None:
-            for xy in self.cur_state.level:
-                for ent in self.cur_state.level[xy]:
-                    yield ent, xy
+            for ent_xy in self.cur_state.all_dynamic_entity_positions():
+                yield ent_xy
+
+    def get_terrain_layer(self) -> typing.Optional[typing.Tuple[pygame.Surface, typing.Tuple[int, int]]]:
+        """returns: (an image of the current state's terrain, the cell at its top-left corner), or None if the state
+            has no terrain. It's only re-rendered when the terrain is edited, or the cell size or colors change.
+        """
+        if self.cur_state is None:
+            return None
+        terrain = self.cur_state.terrain
+        key = (self.cur_state.terrain_version, self.cell_size, sprites.get_cache_generation())
+        if self._terrain_layer is None or self._terrain_layer[0] is not terrain or self._terrain_layer[1] != key:
+            self._terrain_layer = (terrain, key) + self._render_terrain(terrain)
+        _, _, xy, surf = self._terrain_layer
+        return None if surf is None else (surf, xy)
+
+    def _render_terrain(self, terrain):
+        if len(terrain) == 0:
+            return (0, 0), None
+        x, y, w, h = utils.get_rect_containing_points(list(terrain))
+
+        # walls' sprites are opaque, so the gaps between them can be a colorkey (which is much faster to blit than
+        # per-pixel alpha, especially with RLE acceleration)
+        surf = pygame.Surface((w * self.cell_size, h * self.cell_size))
+        surf.fill(_TERRAIN_COLORKEY)
+        for (ent_x, ent_y), ents in terrain.items():
+            for ent in ents:
+                surf.blit(ent.get_sprite(self.cell_size), ((ent_x - x) * self.cell_size, (ent_y - y) * self.cell_size))
+        surf.set_colorkey(_TERRAIN_COLORKEY, pygame.RLEACCEL)
+        return (x, y), surf
+
+    def draw_terrain(self, surf):
+        layer = self.get_terrain_layer()
+        if layer is not None:
+            layer_surf, xy = layer
+            surf.blit(layer_surf, (round(self.xy_offset[0] + self.cell_size * xy[0]),
+                                   round(self.xy_offset[1] + self.cell_size * xy[1])))
 
     def draw_entity_at(self, ent, surf, xy):
         if isinstance(ent, level.Entity):
@@ -88,10 +145,40 @@ class LevelRenderer:
         else:
             return (0, 0)
 
+    def is_animating(self) -> bool:
+        """returns: whether things are moving on their own (other than the sprites' animation frames)."""
+        return False
+
+    def _get_draw_keys(self, surf):
+        """returns: (play area key, top bar key, info area key), each of which changes whenever that part of the
+            screen's appearance does.
+        """
+        common = (self.cur_state, surf.get_size(), self.cell_size, sprites.get_cache_generation())
+        top_bar = (common, self.hint_status, self.hint_move)
+        play_area = (top_bar, self.xy_offset, level.get_anim_idx())
+        info = (common, self.initial_state)
+        return play_area, top_bar, info
+
+    def get_dirty_rects(self, surf) -> typing.Optional[typing.List]:
+        """returns: the areas of the surface that'll look different the next time the level is drawn onto it (compared
+            to the last time), or None if all of it might.
+        """
+        if self._drawn_keys is None or self.is_animating():
+            return None
+        play_rect, info_rect, _ = self.get_play_area_and_info_rects_and_inset(surf)
+        rects = (play_rect, self.get_top_bar_rect(surf), info_rect)
+        return [rect for rect, key, drawn_key in zip(rects, self._get_draw_keys(surf), self._drawn_keys)
+                if key != drawn_key]
+
     def draw(self, surf):
+        self._drawn_keys = self._get_draw_keys(surf)
+        self.draw_terrain(surf)
         for ent, xy in self.all_sorted_entities_to_render():
             self.draw_entity_at(ent, surf, xy)
 
+        if self.hint_move is not None:
+            self.draw_hint(surf)
+
         _, info_rect, inset = self.get_play_area_and_info_rects_and_inset(surf)
 
         self.draw_info(surf, self.get_top_bar_rect(surf), self.get_top_bar_text(), inset=inset)
@@ -101,6 +188,16 @@ class LevelRenderer:
             self.draw_info(surf, info_rect, info_to_draw, bg_color=self.get_info_bg_color(), inset=inset)
         # pygame.draw.rect(surf, (255, 0, 0), info_rect, width=1)
 
+    def draw_hint(self, surf):
+        """Outlines the cell(s) the player(s) should move into next."""
+        color = colors.get_white()
+        for _, xy in self.cur_state.all_entities_with_type(sprites.EntityID.PLAYER):
+            dest_xy = utils.add(xy, self.hint_move)
+            rect = (round(self.xy_offset[0] + self.cell_size * dest_xy[0]),
+                    round(self.xy_offset[1] + self.cell_size * dest_xy[1]),
+                    self.cell_size, self.cell_size)
+            pygame.draw.rect(surf, color, rect, width=2)
+
     def get_play_area_and_info_rects_and_inset(self, surf):
         inset = 8
         info_h = 100
@@ -125,9 +222,30 @@ class LevelRenderer:
                 tr.TextRenderer("", size=sz, color=colors.get_white(), alignment=1))
         self.in_progress_text[0].set_text(f"  Steps: {self.cur_state.step}")
         self.in_progress_text[1].set_text(f"Level: {self.cur_state.name}  ")
-        res.append(self.in_progress_text)
+
+        if self.hint_status is None:
+            res.append(self.in_progress_text)
+        else:
+            if self.hint_text is None:
+                self.hint_text = tr.TextRenderer("", size=sz, color=colors.get_white(), alignment=0)
+            self.hint_text.set_text(f"Hint: {self.get_hint_description()}")
+            res.append(self.in_progress_text + (self.hint_text,))
         return res
 
+    def get_hint_description(self) -> str:
+        if self.hint_status == hints.THINKING:
+            return "thinking..."
+        elif self.hint_status == hints.UNAVAILABLE or self.hint_move is None:
+            return "none"
+        return _MOVE_NAMES[tuple(self.hint_move)]
+
+    def is_stuck(self) -> bool:
+        """returns: whether the current state can't be won anymore."""
+        state = self.cur_state
+        if self._stuck_cache[0] is not state or self._stuck_cache[1] != hash(state):
+            self._stuck_cache = (state, hash(state), deadlocks.is_deadlocked(state))
+        return self._stuck_cache[2]
+
     def get_info_text(self, line_spacing=4, sz="M"):
         res = []
 
@@ -150,10 +268,17 @@ class LevelRenderer:
             if self.goal_text is None:
                 self.goal_text = tr.TextRenderer("", size=sz, color=colors.get_white(), alignment=0)
             n_alive = self.cur_state.num_enemies_remaining()
-            orig_alive = self.cur_state.get_initial_state().num_enemies_remaining()
+            initial_state = self.initial_state or self.cur_state.get_initial_state()
+            orig_alive = initial_state.num_enemies_remaining()
             self.goal_text.set_text(f"Crush all enemies to win! ({(orig_alive - n_alive)}/{orig_alive})")
             res.append(self.goal_text)
 
+            if self.is_stuck():
+                if self.stuck_text is None:
+                    self.stuck_text = tr.TextRenderer("", size=sz, color=colors.get_color(colors.RED_ID), alignment=0)
+                self.stuck_text.set_text("You're stuck! Press [Z] to undo, or [R] to restart.")
+                res.append(self.stuck_text)
+
             if self.dimension_text is None:
                 self.dimension_text = tr.TextRenderer("", size=sz, color=colors.get_white(), alignment=0)
             cur_dim = self.cur_state.get_player_color()
@@ -164,7 +289,7 @@ class LevelRenderer:
 
             if self.controls_text is None:
                 self.controls_text = tr.TextRenderer("", size=sz, color=colors.get_white(), alignment=0)
-            self.controls_text.set_text("[WASD] to Move, [Z] to Undo, [R] to Reset")
+            self.controls_text.set_text("[WASD] to Move, [Z] to Undo, [R] to Reset, [H] for Hint")
             res.append(self.controls_text)
 
         return res
@@ -195,6 +320,11 @@ class LevelRenderer:
             y_offs += line_h
 
 
+_TERRAIN_COLORKEY = (255, 0, 255)
+
+_MOVE_NAMES = {(0, -1): "Up", (-1, 0): "Left", (0, 1): "Down", (1, 0): "Right", (0, 0): "Wait"}
+
+
 _STATIONARY = 0
 _DEAD = 1
 _NEW = 2
@@ -214,6 +344,8 @@ class AnimatedLevelRenderer(LevelRenderer):
         self.smooth_vel = 1 / self.trans_time  # cells / sec
         self._last_rendered_positions = {}
 
+        self._stacks_cache = (None, False)  # (state, whether it has cells with several (spinning) entities)
+
     def draw_entity_at(self, ent, surf, xy):
         xy_to_use = xy
         if not self.smoothing or ent not in self._last_rendered_positions:
@@ -236,6 +368,18 @@ class AnimatedLevelRenderer(LevelRenderer):
         super().draw_entity_at(ent, surf, xy_to_use)
         self._last_rendered_positions[ent] = xy_to_use, inputs.get_time()
 
+    def draw_hint(self, surf):
+        if self.get_interp() >= 1:  # so it doesn't flash in the wrong place while things are moving
+            super().draw_hint(surf)
+
+    def is_animating(self):
+        if inputs.get_time() < self.prev_state_time + 2 * self.trans_time:
+            return True  # moving between states (or smoothing out the last few frames of it)
+        if self._stacks_cache[0] is not self.cur_state:
+            has_stacks = any(len(ents) > 1 for ents in self.cur_state.level.values())
+            self._stacks_cache = (self.cur_state, has_stacks)
+        return self._stacks_cache[1]
+
     def get_interp(self, cur_time=None):
         cur_time = inputs.get_time() if cur_time is None else cur_time
         if cur_time > self.prev_state_time + self.trans_time or self.prev_state is None:
@@ -259,7 +403,6 @@ class AnimatedLevelRenderer(LevelRenderer):
         if self.cur_state is None:
             return ()
 
-        walls = []
         nonwalls = []
 
         cur_time = inputs.get_time()
@@ -267,14 +410,8 @@ class AnimatedLevelRenderer(LevelRenderer):
 
         if interp >= 1:
             # we're not mid-update
-            for xy in self.cur_state.level:
-                temp_nonwalls = []
-                for ent in self.cur_state.level[xy]:
-                    if ent.is_wall():
-                        walls.append((ent, xy))
-                    else:
-                        temp_nonwalls.append((ent, xy))
-
+            for xy, group in itertools.groupby(self.cur_state.all_dynamic_entity_positions(), key=lambda e_xy: e_xy[1]):
+                temp_nonwalls = list(group)
                 if len(temp_nonwalls) <= 1:
                     nonwalls.extend(temp_nonwalls)
                 else:
@@ -285,13 +422,11 @@ class AnimatedLevelRenderer(LevelRenderer):
                         nonwalls.append((ent, (fancy_x, fancy_y)))
         else:
             # we're interpolating
-            cur_ents = {e_xy[0]: e_xy[1] for e_xy in self.cur_state.all_entity_positions()}
-            old_ents = {e_xy[0]: e_xy[1] for e_xy in self.prev_state.all_entity_positions()}
+            cur_ents = {e_xy[0]: e_xy[1] for e_xy in self.cur_state.all_dynamic_entity_positions()}
+            old_ents = {e_xy[0]: e_xy[1] for e_xy in self.prev_state.all_dynamic_entity_positions()}
 
             for e in cur_ents:
-                if e.is_wall():
-                    walls.append((e, cur_ents[e]))
-                elif e not in old_ents:
+                if e not in old_ents:
                     nonwalls.append((e, cur_ents[e]))  # newly spawned?
                 elif cur_ents[e] != old_ents[e]:
                     xy_interp = utils.interpolate(old_ents[e], cur_ents[e], interp, rounded=False)
@@ -306,10 +441,6 @@ class AnimatedLevelRenderer(LevelRenderer):
                                                       color_id=e.color_id)
                     nonwalls.append((spr, utils.add(old_ents[e], (0, 0.001))))  # it died, render an explosion
 
-        walls.sort(key=lambda w_xy: (w_xy[1][1], w_xy[1][0], hash(w_xy[0])))
-        for w_xy in walls:
-            yield w_xy
-
         nonwalls.sort(key=lambda e_xy: (e_xy[1][1], e_xy[1][0], hash(e_xy[0])))
         for e_xy in nonwalls:
             yield e_xy
@@ -0,0 +1,104 @@
+import json
+import time
+import typing
+
+import src.level as level
+import src.gridsim as gridsim
+
+
+# A replay is a string with one character per move.
+MOVE_TO_CHAR = {(0, -1): "W", (-1, 0): "A", (0, 1): "S", (1, 0): "D", (0, 0): "."}
+CHAR_TO_MOVE = {c: move for move, c in MOVE_TO_CHAR.items()}
+
+
+def encode(moves) -> str:
+    return "".join(MOVE_TO_CHAR[tuple(m)] for m in moves)
+
+
+def decode(replay: str) -> typing.List[typing.Tuple[int, int]]:
+    try:
+        return [CHAR_TO_MOVE[c] for c in replay]
+    except KeyError as e:
+        raise ValueError(f"invalid character in replay: {e}")
+
+
+class ReplayResult:
+
+    def __init__(self, name, success, steps, player_died):
+        self.name = name
+        self.success = success  # whether the replay won the level
+        self.steps = steps  # the number of moves it took to win (or to fail)
+        self.player_died = player_died
+
+    def to_json(self) -> dict:
+        return {"name": self.name, "success": self.success, "steps": self.steps, "player_died": self.player_died}
+
+    def __repr__(self):
+        if self.success:
+            status = f"success, steps={self.steps}"
+        else:
+            status = f"died at step {self.steps}" if self.player_died else f"failed after {self.steps} steps"
+        return f"{type(self).__name__}({self.name}, {status})"
+
+
+def run(state: typing.Union[level.State, gridsim.GridState], replay: str) -> ReplayResult:
+    """Plays a replay on a level (headlessly, with no display or sound).
+
+    The game stops as soon as the level is won or the player dies, so any moves after that are ignored. The
+    replay runs on a gridsim.GridState (which follows the same rules as State.get_next, but is much faster).
+    Pass in an already converted state when running several replays on the same level.
+    """
+    cur = gridsim.from_state(state) if isinstance(state, level.State) else state
+    name = cur.board.name
+    steps = 0
+    for move in decode(replay):
+        if cur.is_success() or not cur.is_player_alive():
+            break
+        cur = cur.get_next(move)
+        steps += 1
+
+    alive = cur.is_player_alive()
+    return ReplayResult(name, alive and cur.is_success(), steps, not alive)
+
+
+def verify(levels: typing.Iterable[level.State], replays: typing.Dict[str, str]) -> typing.List[ReplayResult]:
+    """Checks that each replay still wins its level.
+
+    Args:
+        levels: the levels to check.
+        replays: level name -> replay. Levels without a replay are skipped.
+    """
+    res = []
+    for lvl in levels:
+        if lvl.name in replays:
+            res.append(run(gridsim.from_state(lvl), replays[lvl.name]))
+    return res
+
+
+def _main(args=None):
+    import argparse
+    import src.loader as loader
+
+    parser = argparse.ArgumentParser(prog="python -m src.replays",
+                                     description="Checks that saved replays still win their levels.")
+    parser.add_argument("file", help="a json file of level name -> replay, or a save file with replays in it")
+    opts = parser.parse_args(args)
+
+    with open(opts.file, 'r') as f:
+        blob = json.load(f)
+    replays = blob.get(loader.BEST_REPLAYS_KEY, blob)
+
+    loader.load_levels()
+    start_time = time.perf_counter()
+    results = verify(loader.all_levels(), replays)
+    elapsed = time.perf_counter() - start_time
+
+    for r in results:
+        print(f"{'INFO' if r.success else 'ERROR'}: {r}")
+    n_failed = sum(1 for r in results if not r.success)
+    print(f"INFO: verified {len(results)} replay(s) in {elapsed:.3f}s ({n_failed} failed)")
+    return results
+
+
+if __name__ == "__main__":
+    _main()
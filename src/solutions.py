@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import typing
+
+import src.level as level
+import src.replays as replays
+import src.utils as utils
+
+
+# Bump this whenever the rules of the game change (in a way that could change levels' solutions), so that
+# solutions found under the old rules aren't used anymore.
+RULES_VERSION = 1
+
+# the solutions that ship with the game (where it looks for levels' par step counts). The solver only reads it,
+# unless it's explicitly told to save its results there.
+CACHE_PATH = "assets/solutions.json"
+
+
+def level_key(state: level.State) -> str:
+    """returns: a hash of a level's contents (i.e. its json "data" rows) and the rules version.
+
+    Levels with the same contents have the same key, regardless of their names or where they're saved.
+    """
+    blob = state.save_to_json(None)
+    text = json.dumps({"rules": RULES_VERSION, "data": blob[level.DATA_TAG]}, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SolutionCache:
+    """Solver results that have already been found, stored in a json file (level key -> result).
+
+    Each result has the level's name (for reference), the optimal solution as a replay string (see
+    src.replays), its number of steps (or -1 if the level can't be solved), and the number of states the solver
+    explored to find it. Only complete results (i.e. ones where the solver didn't run out of budget) are stored.
+    Levels too hard to solve optimally can have the best solution that's been found instead, which is marked with
+    "optimal": false, along with a "lower_bound" on the optimal solution's steps.
+
+    A read-only cache is never saved (results can still be added to it, but only in memory).
+    """
+
+    def __init__(self, filepath=CACHE_PATH, read_only=False):
+        self.filepath = filepath
+        self.read_only = read_only
+        self._entries: typing.Dict[str, dict] = {}
+        self._dirty = False
+
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                print(f"ERROR: failed to load solution cache: {filepath}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key) -> typing.Optional[dict]:
+        return self._entries.get(key)
+
+    def put(self, key, name, moves: typing.Optional[str], steps, states_seen, optimal=True, lower_bound=None):
+        entry = {"name": name, "moves": moves, "steps": steps, "states_seen": states_seen}
+        if not optimal:
+            old = self._entries.get(key)
+            if old is not None and (old.get("optimal", True) or old["steps"] <= steps):
+                return  # it's no better than what's already known
+            entry["optimal"] = False
+            entry["lower_bound"] = lower_bound
+        self._entries[key] = entry
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty or self.read_only:
+            return
+        # written to a temp file first, so that an interrupted save can't corrupt the cache
+        temp_path = self.filepath + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.filepath)
+        self._dirty = False
+        print(f"INFO: saved {len(self._entries)} solution(s) to {self.filepath}")
+
+
+_SHIPPED_CACHE = None
+
+
+def _get_shipped_cache() -> SolutionCache:
+    global _SHIPPED_CACHE
+    if _SHIPPED_CACHE is None:
+        _SHIPPED_CACHE = SolutionCache(utils.asset_path(CACHE_PATH))
+    return _SHIPPED_CACHE
+
+
+def get_par(state: level.State) -> typing.Optional[int]:
+    """returns: the number of steps in the level's optimal solution, if it's known."""
+    best = get_best_steps(state)
+    return None if best is None or not best[1] else best[0]
+
+
+def get_best_steps(state: level.State) -> typing.Optional[typing.Tuple[int, bool]]:
+    """returns: (the number of steps in the level's shortest known solution, whether it's proven to be optimal), if
+        it has one."""
+    entry = _get_shipped_cache().get(level_key(state))
+    return None if entry is None or entry["steps"] < 0 else (entry["steps"], entry.get("optimal", True))
+
+
+def get_solution(state: level.State) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+    """returns: the moves of the level's optimal solution (from its initial state), if it's known. Best-known
+        solutions that aren't proven to be optimal are left out."""
+    entry = _get_shipped_cache().get(level_key(state))
+    if entry is None or entry["moves"] is None or not entry.get("optimal", True):
+        return None
+    return replays.decode(entry["moves"])
@@ -0,0 +1,1037 @@
+import argparse
+import collections
+import concurrent.futures
+import csv
+import heapq
+import json
+import os
+import sys
+import time
+import tracemalloc
+import typing
+
+import src.level as level
+import src.gridsim as gridsim
+import src.deadlocks as deadlocks
+import src.heuristics as heuristics
+import src.replays as replays
+import src.solutions as solutions
+import src.utils as utils
+
+
+# every input the player can give (including skipping a turn)
+DIRECTIONS = ((0, -1), (-1, 0), (0, 1), (1, 0), (0, 0))
+
+# number of states expanded together by BFSSolver
+BATCH_SIZE = 256
+
+# what a search's result amounts to (see SolverResult.get_status). Only the first two answer the question of what
+# the shortest solution is, solutions that aren't proven to be the shortest ones (e.g. from beam search) don't.
+OPTIMAL = "optimal"
+UNSOLVABLE = "unsolvable"
+NOT_OPTIMAL = "not proven optimal"
+GAVE_UP = "gave up"
+ERROR = "error"
+
+
+class SolverResult:
+
+    def __init__(self, name, moves, nodes_expanded, states_seen, peak_memory, elapsed_time, complete=True,
+                 states_pruned=0, optimal=True, lower_bound=0):
+        self.name = name
+        self.moves: typing.Optional[typing.List[typing.Tuple[int, int]]] = moves  # None if no solution was found
+        self.nodes_expanded = nodes_expanded
+        self.states_seen = states_seen
+        self.peak_memory = peak_memory  # bytes, or None if it wasn't measured
+        self.elapsed_time = elapsed_time  # seconds
+        self.complete = complete  # False if the search ran out of budget before finishing
+        self.states_pruned = states_pruned  # states that weren't searched because they were deadlocked
+        self.optimal = optimal  # False if the search doesn't guarantee the shortest solution
+        self.lower_bound = lower_bound  # no solution takes fewer steps than this
+
+    def is_solved(self) -> bool:
+        return self.moves is not None
+
+    def num_steps(self) -> int:
+        return -1 if self.moves is None else len(self.moves)
+
+    def get_status(self) -> str:
+        if self.is_solved():
+            return OPTIMAL if self.optimal else NOT_OPTIMAL
+        return UNSOLVABLE if self.complete else GAVE_UP
+
+    def to_json(self) -> dict:
+        return {
+            "name": self.name,
+            "status": self.get_status(),
+            "steps": self.num_steps(),
+            "moves": None if self.moves is None else [list(m) for m in self.moves],
+            "nodes_expanded": self.nodes_expanded,
+            "states_seen": self.states_seen,
+            "states_pruned": self.states_pruned,
+            "peak_memory": self.peak_memory,
+            "elapsed_time": self.elapsed_time,
+            "complete": self.complete,
+            "optimal": self.optimal,
+            "lower_bound": self.lower_bound
+        }
+
+    def __repr__(self):
+        mem = "?" if self.peak_memory is None else f"{self.peak_memory / 1024 / 1024:.1f}MB"
+        status = self.get_status()
+        if self.is_solved():
+            status = f"steps={self.num_steps()}" + ("" if self.optimal else f" ({status}, >={self.lower_bound})")
+        return (f"{type(self).__name__}({self.name}, {status}, expanded={self.nodes_expanded}, "
+                f"seen={self.states_seen}, pruned={self.states_pruned}, mem={mem}, time={self.elapsed_time:.3f}s)")
+
+
+class Solver:
+    """Base class for the searches below, which all share the same interface.
+
+    A search can be advanced a bit at a time with `step`, or all at once with `run`. States that can't be won
+    anymore (see src.deadlocks) aren't searched any further, unless prune_deadlocks is False.
+
+    The level can be given as a level.State, or as a gridsim.GridState (e.g. to search from the middle of a level).
+
+    Each search has a memory budget (max_states, the number of states it keeps track of at once) and a node budget
+    (max_expanded, the number of states it expands in total), and gives up once it hits either of them.
+    """
+
+    def __init__(self, state: typing.Union[level.State, gridsim.GridState], max_states=None, max_expanded=None,
+                 prune_deadlocks=True):
+        self._start = state if isinstance(state, gridsim.GridState) else gridsim.from_state(state)
+        self.name = self._start.board.name
+        self.max_states = max_states
+        self.max_expanded = max_expanded
+
+        self._start_key = self._start.key()
+        self._deadlocks = deadlocks.DeadlockDetector(self._start.board) if prune_deadlocks else None
+        self._stepper = gridsim.BatchStepper(self._start.board)
+
+        self._out_of_budget = False
+        self.nodes_expanded = 0
+        self.states_pruned = 0
+        self.elapsed_time = 0
+
+    def is_optimal(self) -> bool:
+        """returns: whether the solutions this search finds are guaranteed to be the shortest ones."""
+        return True
+
+    def is_done(self) -> bool:
+        raise NotImplementedError()
+
+    def step(self, max_nodes=1000) -> bool:
+        """Expands up to (about) max_nodes states.
+        returns: whether the search is finished.
+        """
+        start_time = time.perf_counter()
+        n = self._expand(max_nodes)
+        self.nodes_expanded += n
+        if self.max_expanded is not None and self.nodes_expanded >= self.max_expanded and not self.is_solved():
+            self._out_of_budget = True
+        self.elapsed_time += time.perf_counter() - start_time
+        return self.is_done()
+
+    def _expand(self, max_nodes) -> int:
+        """Expands up to (about) max_nodes states.
+        returns: the number of states that were expanded.
+        """
+        raise NotImplementedError()
+
+    def _is_prunable(self, state: gridsim.GridState) -> bool:
+        if self._deadlocks is not None and self._deadlocks.is_deadlocked(state):
+            self.states_pruned += 1
+            return True
+        return False
+
+    def run(self, time_limit=None) -> bool:
+        """Expands states until the search finishes (or the time limit, in seconds, is reached).
+        returns: whether the search is finished.
+        """
+        end_time = None if time_limit is None else time.perf_counter() + time_limit
+        while not self.step():
+            if end_time is not None and time.perf_counter() >= end_time:
+                return False
+        return True
+
+    def is_solved(self) -> bool:
+        return self.get_moves() is not None
+
+    def is_complete(self) -> bool:
+        """returns: whether the search found a solution or proved there isn't one."""
+        raise NotImplementedError()
+
+    def get_moves(self) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        raise NotImplementedError()
+
+    def get_states_seen(self) -> int:
+        raise NotImplementedError()
+
+    def release(self) -> list:
+        """Hands over the containers that hold the search's states (and its helpers' caches), so that the caller can
+        free them a bit at a time (freeing a big search all at once can take tens of milliseconds). The search can't
+        be used anymore afterwards.
+
+        returns: the containers (dicts, lists, sets and deques), which the search doesn't refer to anymore.
+        """
+        res = self._stepper.release()
+        if self._deadlocks is not None:
+            res.extend(self._deadlocks.release())
+        res.extend(self._release_states())
+        return res
+
+    def _release_states(self) -> list:
+        """returns: the search's own containers (see `release`), once they've been replaced with empty ones."""
+        raise NotImplementedError()
+
+    def get_lower_bound(self) -> int:
+        """returns: the fewest steps a solution could take, as far as the search has proven."""
+        moves = self.get_moves()
+        return len(moves) if moves is not None and self.is_optimal() else 0
+
+    def get_result(self, peak_memory=None) -> SolverResult:
+        return SolverResult(self.name, self.get_moves(), self.nodes_expanded, self.get_states_seen(), peak_memory,
+                            self.elapsed_time, complete=self.is_complete(), states_pruned=self.states_pruned,
+                            optimal=self.is_optimal(), lower_bound=self.get_lower_bound())
+
+
+def _trace_moves(parents, key) -> typing.List[typing.Tuple[int, int]]:
+    """returns: the moves that lead to the given state, from a dict of state key -> (parent key, move idx)."""
+    res = []
+    while parents[key] is not None:
+        key, move_idx = parents[key]
+        res.append(DIRECTIONS[move_idx])
+    res.reverse()
+    return res
+
+
+class BFSSolver(Solver):
+    """Breadth-first search for the shortest sequence of moves that wins a level (without the player dying).
+
+    States are searched a layer at a time (see gridsim.BatchStepper.step_layer): states that only differ by where
+    the player is are stepped together, and stored as one key plus a bitmask of the player's positions, which makes
+    each state several times cheaper to expand and to keep in memory. Levels with more than one player are searched
+    one state at a time instead.
+
+    It keeps every state it has seen in memory, so max_states limits how many states it can look at in total.
+    """
+
+    def __init__(self, state: level.State, max_states=None, max_expanded=None, prune_deadlocks=True):
+        super().__init__(state, max_states=max_states, max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+        self.depth = 0  # number of moves that have been fully searched (so any solution is longer than this)
+        self._goal = None  # (layer key, player idx, number of moves) of the solution that was found
+        self._goal_key = None  # key of the solution's last state, when searching one state at a time
+        self._moves = None  # the solution's moves, once they've been traced
+
+        self._layered = len(self._start.players) == 1
+        if self._layered:
+            start_key = self._start.layer_key()
+            start_cells = 1 << self._start.players[0][0]
+            self._seen = {start_key: start_cells}  # layer key -> player positions that have been seen
+            self._num_seen = 1
+            # depth -> layer key -> (player positions first seen at that depth, *keys of their parent layers)
+            self._layers: typing.List[typing.Dict[bytes, tuple]] = [{start_key: (start_cells,)}]
+            self._frontier = [(start_key, self._start, start_cells)]  # the layers being expanded
+            self._frontier_idx = 0
+            self._next: typing.Dict[bytes, list] = {}  # layer key -> [state, player positions, *parent keys]
+            if self._start.is_success():
+                self._goal = (start_key, self._start.players[0][0], 0)
+        else:
+            self._parents = {self._start_key: None}  # state key -> (parent key, move idx)
+            self._state_frontier = collections.deque([self._start])
+            if self._start.is_success() and self._start.is_player_alive():
+                self._goal_key = self._start_key
+
+    def is_done(self) -> bool:
+        if self._goal is not None or self._goal_key is not None or self._out_of_budget:
+            return True
+        elif self._layered:
+            return self._frontier_idx == len(self._frontier) and len(self._next) == 0
+        else:
+            return len(self._state_frontier) == 0
+
+    def _expand(self, max_nodes) -> int:
+        return self._expand_layers(max_nodes) if self._layered else self._expand_states(max_nodes)
+
+    def _expand_layers(self, max_nodes) -> int:
+        n = 0
+        while n < max_nodes and not self.is_done():
+            if self._frontier_idx == len(self._frontier):
+                self._start_next_depth()
+                continue
+            key, cur, cells = self._frontier[self._frontier_idx]
+            self._frontier_idx += 1
+            n += _count_cells(cells)
+
+            moved_cells, world, others = self._stepper.step_layer(cur, cells, DIRECTIONS)
+            if world is not None:
+                self._add_to_layer(world.layer_key(), world, moved_cells, key)
+            for nxt in others:
+                if nxt.is_player_alive():
+                    self._add_to_layer(nxt.layer_key(), nxt, 1 << nxt.players[0][0], key)
+
+            if self._goal is not None:
+                self._layers.append({k: tuple(entry[1:]) for k, entry in self._next.items()})
+                self._next.clear()
+            elif self.max_states is not None and self._num_seen >= self.max_states:
+                self._out_of_budget = True
+        return n
+
+    def _add_to_layer(self, key, state: gridsim.GridState, cells, parent_key):
+        seen = self._seen.get(key, 0)
+        new_cells = cells & ~seen
+        if new_cells == 0:
+            return
+        self._seen[key] = seen | new_cells
+        self._num_seen += _count_cells(new_cells)
+
+        entry = self._next.get(key)
+        if entry is None:
+            self._next[key] = [state, new_cells, parent_key]
+        else:
+            entry[1] |= new_cells
+            if entry[-1] != parent_key:
+                entry.append(parent_key)
+        if state.is_success() and self._goal is None:
+            self._goal = (key, (new_cells & -new_cells).bit_length() - 1, self.depth + 1)
+
+    def _start_next_depth(self):
+        self.depth += 1
+        layer = {}
+        self._frontier = []
+        self._frontier_idx = 0
+        for key, (state, cells, *parent_keys) in self._next.items():
+            layer[key] = (cells, *parent_keys)
+            if self._deadlocks is not None and self._deadlocks.is_deadlocked(state):
+                self.states_pruned += _count_cells(cells)
+            else:
+                self._frontier.append((key, state, cells))
+        self._layers.append(layer)
+        self._next = {}
+
+    def _trace_layers(self) -> typing.List[typing.Tuple[int, int]]:
+        """returns: the moves that lead to the goal, found by stepping each of its parent layers' states until one
+            of them gets there."""
+        board = self._start.board
+        key, idx, depth = self._goal
+        res = []
+        while depth > 0:
+            for parent_key in self._layers[depth][key][1:]:
+                parent_cells = self._layers[depth - 1].get(parent_key, (0,))[0]
+                move = self._find_move(board, parent_key, parent_cells, key, idx)
+                if move is not None:
+                    idx, direction = move
+                    break
+            else:
+                raise ValueError(f"failed to trace the solution back from {depth} moves in")
+            res.append(direction)
+            key = parent_key
+            depth -= 1
+        res.reverse()
+        return res
+
+    @staticmethod
+    def _find_move(board: gridsim.Board, parent_key, parent_cells, key, idx):
+        """returns: (player idx, direction) of a state in the parent layer that steps to the given one, if any."""
+        while parent_cells != 0:
+            low = parent_cells & -parent_cells
+            parent_cells ^= low
+            parent = gridsim.GridState.from_layer_key(board, parent_key, low.bit_length() - 1)
+            for direction in DIRECTIONS:
+                nxt = parent.get_next(direction)
+                if nxt.is_player_alive() and nxt.players[0][0] == idx and nxt.layer_key() == key:
+                    return low.bit_length() - 1, direction
+        return None
+
+    def _expand_states(self, max_nodes) -> int:
+        parents = self._parents
+        frontier = self._state_frontier
+        n = 0
+        while n < max_nodes and not self.is_done():
+            # states are expanded in batches (which is faster, see gridsim.BatchStepper), in the same order
+            # they'd be expanded one at a time.
+            batch = [frontier.popleft() for _ in range(min(len(frontier), max_nodes - n, BATCH_SIZE))]
+            keys, successors = self._stepper.step(batch, DIRECTIONS, skip=parents)
+            for i, cur in enumerate(batch):
+                if self._goal_key is not None or self._out_of_budget:
+                    frontier.extendleft(reversed(batch[i:]))  # put back the ones that weren't expanded
+                    break
+                cur_key = cur.key()
+                n += 1
+                for move_idx in range(len(DIRECTIONS)):
+                    key = keys[i * len(DIRECTIONS) + move_idx]
+                    if key in parents:
+                        continue
+                    nxt = successors[i * len(DIRECTIONS) + move_idx]
+                    if not nxt.is_player_alive():
+                        continue
+                    parents[key] = (cur_key, move_idx)
+                    if nxt.is_success():
+                        self._goal_key = key
+                        break
+                    if not self._is_prunable(nxt):
+                        frontier.append(nxt)
+
+                if self.max_states is not None and len(parents) >= self.max_states and self._goal_key is None:
+                    self._out_of_budget = True
+        return n
+
+    def is_complete(self) -> bool:
+        return self._goal is not None or self._goal_key is not None or (self.is_done() and not self._out_of_budget)
+
+    def get_moves(self) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        if self._goal is not None:
+            if self._moves is None:
+                self._moves = self._trace_layers()
+            return self._moves
+        return None if self._goal_key is None else _trace_moves(self._parents, self._goal_key)
+
+    def get_states_seen(self) -> int:
+        return self._num_seen if self._layered else len(self._parents)
+
+    def _release_states(self) -> list:
+        if self._layered:
+            res = [self._seen, self._layers, self._frontier, self._next]
+            self._seen, self._layers, self._frontier, self._next = {}, [], [], {}
+        else:
+            res = [self._parents, self._state_frontier]
+            self._parents, self._state_frontier = {}, collections.deque()
+        return res
+
+    def get_lower_bound(self) -> int:
+        if self._goal is not None or self._goal_key is not None:
+            return len(self.get_moves())
+        # every shorter sequence of moves has been searched (depths aren't tracked when searching one state at a
+        # time, though, so then this is just 1)
+        return self.depth + 1
+
+
+def _count_cells(cells: int) -> int:
+    return bin(cells).count("1")
+
+
+def _get_heuristic(heuristic) -> typing.Tuple[typing.Callable[[gridsim.GridState], int], bool]:
+    """returns: (the heuristic function, whether it's admissible), from a function or a name in
+        heuristics.HEURISTICS. Functions that aren't one of the built-in admissible ones are assumed to be
+        inadmissible.
+    """
+    if isinstance(heuristic, str):
+        if heuristic not in heuristics.HEURISTICS:
+            raise ValueError(f"unrecognized heuristic: {heuristic}")
+        return heuristics.HEURISTICS[heuristic], heuristic in heuristics.ADMISSIBLE
+    return heuristic, any(heuristic is heuristics.HEURISTICS[name] for name in heuristics.ADMISSIBLE)
+
+
+class AStarSolver(Solver):
+    """(Weighted) A* search, which expands states in order of g + weight * h (where g is the number of steps it
+    took to get to a state, and h is the heuristic's estimate of the number of steps left).
+
+    With weight=1 and an admissible heuristic, the solutions it finds are optimal. Higher weights make it greedier,
+    so it usually expands fewer states, but its solutions can be up to weight times longer than the shortest one.
+    Like BFSSolver, it keeps every state it has seen in memory.
+    """
+
+    def __init__(self, state: level.State, heuristic="combined", weight=1.0, max_states=None, max_expanded=None,
+                 prune_deadlocks=True):
+        super().__init__(state, max_states=max_states, max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+        self.heuristic, self.admissible = _get_heuristic(heuristic)
+        self.weight = weight
+
+        self._parents = {self._start_key: None}  # state key -> (parent key, move idx)
+        self._costs = {self._start_key: 0}  # state key -> fewest steps it's been reached in
+        self._open = []  # heap of (f, -g, tiebreaker, state)
+        self._counter = 0
+        self._goal_key = None
+        self._push(self._start, 0)
+
+    def _push(self, state: gridsim.GridState, g):
+        # ties are broken in favor of deeper states (which are closer to the goal), then first in first out
+        self._counter += 1
+        heapq.heappush(self._open, (g + self.weight * self.heuristic(state), -g, self._counter, state))
+
+    def is_optimal(self) -> bool:
+        return self.admissible and self.weight <= 1
+
+    def is_done(self) -> bool:
+        return self._goal_key is not None or self._out_of_budget or len(self._open) == 0
+
+    def _expand(self, max_nodes) -> int:
+        n = 0
+        while n < max_nodes and not self.is_done():
+            _, neg_g, _, cur = heapq.heappop(self._open)
+            g = -neg_g
+            cur_key = cur.key()
+            if g > self._costs[cur_key]:
+                continue  # it was reached again by a shorter path after this entry was added
+
+            # the goal test happens when a state is expanded (rather than when it's first seen), since a
+            # shorter path to it could still be found until then.
+            if cur.is_success():
+                self._goal_key = cur_key
+                break
+
+            n += 1
+            keys, successors = self._stepper.step([cur], DIRECTIONS)
+            for move_idx, (key, nxt) in enumerate(zip(keys, successors)):
+                if self._costs.get(key, g + 2) <= g + 1 or not nxt.is_player_alive():
+                    continue
+                self._costs[key] = g + 1
+                self._parents[key] = (cur_key, move_idx)
+                if not self._is_prunable(nxt):
+                    self._push(nxt, g + 1)
+
+            if self.max_states is not None and len(self._costs) >= self.max_states:
+                self._out_of_budget = True
+        return n
+
+    def is_complete(self) -> bool:
+        return self._goal_key is not None or len(self._open) == 0
+
+    def get_moves(self) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        return None if self._goal_key is None else _trace_moves(self._parents, self._goal_key)
+
+    def get_states_seen(self) -> int:
+        return len(self._costs)
+
+    def _release_states(self) -> list:
+        res = [self._parents, self._costs, self._open]
+        self._parents, self._costs, self._open = {}, {}, []
+        return res
+
+
+class IDAStarSolver(Solver):
+    """Iterative-deepening A*, which does depth-first searches that are cut off once g + h exceeds a threshold,
+    raising the threshold after each one until a solution is found.
+
+    It only needs memory for the current path, plus a table of the fewest steps each state has been reached in
+    during the current iteration (so that it doesn't search the same states over and over), which holds at most
+    max_states states. Once the table is full, states that aren't in it are searched without it (which is slower,
+    but still correct). With an admissible heuristic, the solutions it finds are optimal.
+    """
+
+    def __init__(self, state: level.State, heuristic="combined", max_states=None, max_expanded=None,
+                 prune_deadlocks=True):
+        super().__init__(state, max_states=max_states, max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+        self.heuristic, self.admissible = _get_heuristic(heuristic)
+
+        self.threshold = self.heuristic(self._start)
+        self.iterations = 0
+        self._next_threshold = None  # lowest f that was over the threshold during the current iteration
+        self._table: typing.Dict[bytes, int] = {}
+        self._stack = []  # list of [state, g, successors (once expanded), idx of the next move to try]
+        self._max_table_size = 0
+        self._exhausted = False
+        self._moves = None
+        self._start_iteration()
+
+    def _start_iteration(self):
+        self.iterations += 1
+        self._next_threshold = None
+        self._table = {self._start_key: 0}
+        self._stack = [[self._start, 0, None, 0]]
+
+    def is_optimal(self) -> bool:
+        return self.admissible
+
+    def is_done(self) -> bool:
+        return self._moves is not None or self._out_of_budget or self._exhausted
+
+    def _expand(self, max_nodes) -> int:
+        table = self._table
+        n = 0
+        while n < max_nodes and not self.is_done():
+            if len(self._stack) == 0:
+                if self._next_threshold is None:
+                    self._exhausted = True  # nothing was cut off, so there's no solution
+                    break
+                self.threshold = self._next_threshold
+                self._start_iteration()
+                table = self._table
+                continue
+
+            frame = self._stack[-1]
+            cur, g, successors, move_idx = frame
+            if successors is None:
+                if cur.is_success():
+                    self._moves = [DIRECTIONS[f[3] - 1] for f in self._stack[:-1]]
+                    break
+                f = g + self.heuristic(cur)
+                if f > self.threshold:
+                    if self._next_threshold is None or f < self._next_threshold:
+                        self._next_threshold = f
+                    self._stack.pop()
+                    continue
+                n += 1
+                successors = frame[2] = self._stepper.step([cur], DIRECTIONS)
+
+            if move_idx >= len(DIRECTIONS):
+                self._stack.pop()
+                continue
+            frame[3] += 1
+
+            key, nxt = successors[0][move_idx], successors[1][move_idx]
+            if table.get(key, g + 2) <= g + 1 or not nxt.is_player_alive():
+                continue
+            if key in table or self.max_states is None or len(table) < self.max_states:
+                table[key] = g + 1
+            if not self._is_prunable(nxt):
+                self._stack.append([nxt, g + 1, None, 0])
+
+        self._max_table_size = max(self._max_table_size, len(table))
+        return n
+
+    def is_complete(self) -> bool:
+        return self._moves is not None or self._exhausted
+
+    def get_moves(self) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        return self._moves
+
+    def get_states_seen(self) -> int:
+        return self._max_table_size
+
+    def _release_states(self) -> list:
+        res = [self._table, self._stack]
+        self._table, self._stack = {}, []
+        return res
+
+
+class BeamSolver(BFSSolver):
+    """Beam search, which is a breadth-first search that only keeps the most promising states (according to the
+    heuristic) of each depth.
+
+    Like BFSSolver, it searches a layer of states (that only differ by where the player is) at a time. It keeps
+    the beam_width best layers of each depth (breaking ties in favor of layers with more player positions), but at
+    most per_arrangement of them with the same boxes, potions and colors, so that the beam isn't used up by one
+    arrangement of boxes with the enemies in slightly different places. Levels with more than one player are
+    searched one state at a time, keeping the beam_width best states of each depth.
+
+    It needs far less memory and time than the other searches, but its solutions might not be the shortest ones,
+    and it can miss solutions entirely (so it never proves that a level can't be solved).
+    """
+
+    def __init__(self, state: level.State, heuristic="progress", beam_width=2000, per_arrangement=4,
+                 max_states=None, max_expanded=None, prune_deadlocks=True):
+        super().__init__(state, max_states=max_states, max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+        self.heuristic, _ = _get_heuristic(heuristic)
+        self.beam_width = beam_width
+        self.per_arrangement = per_arrangement  # or None for no limit
+
+    def is_optimal(self) -> bool:
+        return False
+
+    def _start_next_depth(self):
+        self.depth += 1
+        candidates = []
+        for key, (state, cells, *parent_keys) in self._next.items():
+            if self._deadlocks is not None and self._deadlocks.is_deadlocked(state):
+                self.states_pruned += _count_cells(cells)
+            else:
+                candidates.append((self.heuristic(state), -_count_cells(cells), len(candidates), key, state, cells,
+                                   parent_keys))
+        candidates.sort(key=lambda c: c[:3])
+
+        # only the layers that are kept are needed to trace the solution (their parents were all kept too)
+        layer = {}
+        self._frontier = []
+        self._frontier_idx = 0
+        arrangements = collections.Counter()
+        for _, _, _, key, state, cells, parent_keys in candidates:
+            if len(self._frontier) >= self.beam_width:
+                break
+            if self.per_arrangement is not None:
+                arrangement = (state.boxes, state.potions, state.players[0][1],
+                               tuple(sorted(e[1] for e in state.enemies)))
+                if arrangements[arrangement] >= self.per_arrangement:
+                    continue
+                arrangements[arrangement] += 1
+            layer[key] = (cells, *parent_keys)
+            self._frontier.append((key, state, cells))
+        self._layers.append(layer)
+        self._next = {}
+
+    def _expand_states(self, max_nodes) -> int:
+        parents = self._parents
+        n = 0
+        while n < max_nodes and not self.is_done():
+            # a whole depth is expanded at once (so this can go a bit over max_nodes)
+            layer = list(self._state_frontier)
+            keys, successors = self._stepper.step(layer, DIRECTIONS, skip=parents)
+            candidates = []
+            for i, cur in enumerate(layer):
+                cur_key = cur.key()
+                for move_idx in range(len(DIRECTIONS)):
+                    key = keys[i * len(DIRECTIONS) + move_idx]
+                    if key in parents:
+                        continue
+                    nxt = successors[i * len(DIRECTIONS) + move_idx]
+                    if not nxt.is_player_alive():
+                        continue
+                    parents[key] = (cur_key, move_idx)
+                    if nxt.is_success():
+                        self._goal_key = key
+                        break
+                    if not self._is_prunable(nxt):
+                        candidates.append((self.heuristic(nxt), len(candidates), nxt))
+                if self._goal_key is not None:
+                    break
+            n += len(layer)
+
+            candidates.sort(key=lambda c: c[:2])
+            self._state_frontier = collections.deque(c[2] for c in candidates[:self.beam_width])
+            if self.max_states is not None and len(parents) >= self.max_states and self._goal_key is None:
+                self._out_of_budget = True
+        return n
+
+    def is_complete(self) -> bool:
+        return self._goal is not None or self._goal_key is not None
+
+    def get_lower_bound(self) -> int:
+        return Solver.get_lower_bound(self)  # the depths it has searched don't prove anything
+
+
+class AutoSolver(Solver):
+    """Looks for the shortest solution with a BFSSolver, and if that runs out of budget (bfs_states), falls back to
+    a BeamSolver, which finds solutions to much harder levels, but can't promise they're the shortest ones.
+
+    The depths the BFS got through still prove how short a solution could be (see `get_lower_bound`).
+    """
+
+    def __init__(self, state: level.State, heuristic="progress", beam_width=2000, bfs_states=1000000,
+                 max_states=None, max_expanded=None, prune_deadlocks=True):
+        super().__init__(state, max_states=max_states, max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+        self.heuristic = heuristic
+        self.beam_width = beam_width
+        self.prune_deadlocks = prune_deadlocks
+
+        if max_states is not None:
+            bfs_states = min(bfs_states, max_states)
+        self._bfs = BFSSolver(self._start, max_states=bfs_states, max_expanded=max_expanded,
+                              prune_deadlocks=prune_deadlocks)
+        self._beam: typing.Optional[BeamSolver] = None
+        self._lower_bound = 0
+        self._bfs_states_seen = 0
+        self._bfs_states_pruned = 0
+
+    def _search(self) -> Solver:
+        return self._bfs if self._beam is None else self._beam
+
+    def is_optimal(self) -> bool:
+        return self._beam is None
+
+    def is_done(self) -> bool:
+        return self._out_of_budget or self._search().is_done()
+
+    def _expand(self, max_nodes) -> int:
+        search = self._search()
+        nodes_expanded = search.nodes_expanded
+        search.step(max_nodes)
+        self.states_pruned = self._bfs_states_pruned + search.states_pruned
+        if search is self._bfs and self._bfs.is_done() and not self._bfs.is_complete():
+            # it ran out of budget, so settle for a solution that might not be the shortest
+            self._lower_bound = self._bfs.get_lower_bound()
+            self._bfs_states_seen = self._bfs.get_states_seen()
+            self._bfs_states_pruned = self._bfs.states_pruned
+            max_states = None if self.max_states is None else self.max_states - self._bfs_states_seen
+            max_expanded = None if self.max_expanded is None else self.max_expanded - self._bfs.nodes_expanded
+            self._beam = BeamSolver(self._start, heuristic=self.heuristic, beam_width=self.beam_width,
+                                    max_states=max_states, max_expanded=max_expanded,
+                                    prune_deadlocks=self.prune_deadlocks)
+            self._bfs = None  # so its memory can be freed
+        return search.nodes_expanded - nodes_expanded
+
+    def is_complete(self) -> bool:
+        return self._search().is_complete()
+
+    def get_moves(self) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        return self._search().get_moves()
+
+    def get_lower_bound(self) -> int:
+        return self._bfs.get_lower_bound() if self._beam is None else self._lower_bound
+
+    def get_states_seen(self) -> int:
+        return self._bfs_states_seen + self._search().get_states_seen()
+
+    def _release_states(self) -> list:
+        return self._search().release()
+
+
+# name -> search strategy
+MODES = ("bfs", "astar", "ida", "beam", "auto")
+
+
+def make_solver(state: level.State, mode="bfs", heuristic=None, weight=1.0, beam_width=2000,
+                bfs_states=1000000, max_states=None, max_expanded=None, prune_deadlocks=True) -> Solver:
+    """returns: a search of the given mode (see MODES). The heuristic (which defaults to "progress" for the beam
+        and auto modes, and "combined" for the others), weight, beam_width and bfs_states only apply to the modes
+        that use them.
+    """
+    if mode == "bfs":
+        return BFSSolver(state, max_states=max_states, max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+    elif mode == "astar":
+        return AStarSolver(state, heuristic=heuristic or "combined", weight=weight, max_states=max_states,
+                           max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+    elif mode == "ida":
+        return IDAStarSolver(state, heuristic=heuristic or "combined", max_states=max_states,
+                             max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+    elif mode == "beam":
+        return BeamSolver(state, heuristic=heuristic or "progress", beam_width=beam_width, max_states=max_states,
+                          max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+    elif mode == "auto":
+        return AutoSolver(state, heuristic=heuristic or "progress", beam_width=beam_width, bfs_states=bfs_states,
+                          max_states=max_states, max_expanded=max_expanded, prune_deadlocks=prune_deadlocks)
+    else:
+        raise ValueError(f"unrecognized solver mode: {mode}")
+
+
+def solve(state: level.State, max_states=None, time_limit=None, measure_memory=True,
+          prune_deadlocks=True, mode="bfs", **search_options) -> SolverResult:
+    """Finds the shortest solution to a level (or, with a mode other than bfs, astar or ida, a solution that might
+    not be the shortest one, which the result's optimal flag and status say).
+
+    Args:
+        state: the level to solve.
+        max_states: gives up after this many distinct states have been seen (or never, if None).
+        time_limit: gives up after this many seconds (or never, if None).
+        measure_memory: whether to track the search's peak memory usage (using tracemalloc, which is a bit slower).
+        prune_deadlocks: whether to skip states that provably can't be won.
+        mode: which search to use (see `make_solver`). BFS is always exact, but it can run out of memory on the
+            hardest levels.
+        search_options: the search's settings (see `make_solver`).
+    """
+    tracing = measure_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        search = make_solver(state, mode=mode, max_states=max_states, prune_deadlocks=prune_deadlocks,
+                             **search_options)
+        search.run(time_limit=time_limit)
+        peak_memory = None
+        if measure_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    return search.get_result(peak_memory=peak_memory)
+
+
+def solve_file(filepath, max_states=None, time_limit=None, measure_memory=False, prune_deadlocks=True,
+               **search_options) -> dict:
+    """Loads a level from a json file and solves it.
+    returns: the result, as json (so it can be sent back from a worker process).
+    """
+    with open(filepath, 'r') as f:
+        state = level.from_json(json.load(f))
+    res = solve(state, max_states=max_states, time_limit=time_limit, measure_memory=measure_memory,
+                prune_deadlocks=prune_deadlocks, **search_options).to_json()
+    res["file"] = filepath
+    return res
+
+
+def solve_files(filepaths, workers=None, max_states=None, time_limit=None, measure_memory=False,
+                prune_deadlocks=True, cache: typing.Optional[solutions.SolutionCache] = None,
+                **search_options) -> typing.List[dict]:
+    """Solves a batch of level files in parallel, using a pool of worker processes.
+
+    Args:
+        filepaths: the level files to solve.
+        workers: the number of processes to use (defaults to the number of CPUs).
+        max_states, time_limit, measure_memory, prune_deadlocks: the budget and options for each level (see `solve`).
+        cache: if given, levels that are already in the cache aren't solved again, and new results are added to it
+            (if they're complete, and unless the cache is read-only).
+        search_options: which search to use, and its settings (see `make_solver`).
+    returns: each level's result (as json), in the same order as filepaths.
+    """
+    res = [None] * len(filepaths)
+    keys = {}  # idx -> level key
+    to_solve = []
+    for i, path in enumerate(filepaths):
+        if cache is not None:
+            try:
+                with open(path, 'r') as f:
+                    keys[i] = solutions.level_key(level.from_json(json.load(f)))
+            except Exception as e:
+                res[i] = _error_result(path, e)
+                print(f"ERROR: failed to load {path}: {res[i]['error']}")
+                continue
+            entry = cache.get(keys[i])
+            if entry is not None:
+                res[i] = _cached_result(path, entry)
+                print(f"INFO: {res[i]['name']} ({path}) is unchanged, using its cached solution: "
+                      f"steps={res[i]['steps']}" + ("" if res[i]["optimal"] else f" ({res[i]['status']})"))
+                continue
+        to_solve.append(i)
+
+    if len(to_solve) > 0:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(solve_file, filepaths[i], max_states=max_states, time_limit=time_limit,
+                                   measure_memory=measure_memory, prune_deadlocks=prune_deadlocks,
+                                   **search_options): i
+                       for i in to_solve}
+            for future in concurrent.futures.as_completed(futures):
+                i = futures[future]
+                try:
+                    res[i] = future.result()
+                except Exception as e:
+                    # one broken level shouldn't lose the rest of the batch's results
+                    res[i] = _error_result(filepaths[i], e)
+                    print(f"ERROR: failed to solve {filepaths[i]}: {res[i]['error']}")
+                    continue
+                status = res[i]["status"]
+                if status == NOT_OPTIMAL:
+                    # this doesn't say what the shortest solution is, so it's not reported as solved
+                    print(f"WARN: found a solution for {res[i]['name']} ({res[i]['file']}) that isn't proven to be "
+                          f"the shortest: steps={res[i]['steps']}, but the shortest could be as short as "
+                          f"{res[i]['lower_bound']}, seen={res[i]['states_seen']}, "
+                          f"time={res[i]['elapsed_time']:.3f}s")
+                else:
+                    verb = {OPTIMAL: "solved", UNSOLVABLE: "found no solution for", GAVE_UP: "gave up on"}[status]
+                    print(f"INFO: {verb} {res[i]['name']} ({res[i]['file']}): steps={res[i]['steps']}, "
+                          f"seen={res[i]['states_seen']}, time={res[i]['elapsed_time']:.3f}s")
+                if cache is not None and res[i]["complete"]:
+                    moves = None if res[i]["moves"] is None else replays.encode(res[i]["moves"])
+                    cache.put(keys[i], res[i]["name"], moves, res[i]["steps"], res[i]["states_seen"],
+                              optimal=res[i]["optimal"], lower_bound=res[i]["lower_bound"])
+
+    if cache is not None:
+        cache.save()
+    return res
+
+
+def _cached_result(filepath, entry: dict) -> dict:
+    return {
+        "file": filepath,
+        "name": entry["name"],
+        "status": (UNSOLVABLE if entry["steps"] < 0 else OPTIMAL) if entry.get("optimal", True) else NOT_OPTIMAL,
+        "steps": entry["steps"],
+        "moves": None if entry["moves"] is None else [list(m) for m in replays.decode(entry["moves"])],
+        "nodes_expanded": None,
+        "states_seen": entry["states_seen"],
+        "states_pruned": None,
+        "peak_memory": None,
+        "elapsed_time": 0,
+        "complete": True,
+        "optimal": entry.get("optimal", True),
+        "lower_bound": entry.get("lower_bound", entry["steps"]),
+        "cached": True
+    }
+
+
+def _error_result(filepath, error: Exception) -> dict:
+    return {
+        "file": filepath,
+        "name": os.path.splitext(os.path.basename(filepath))[0],
+        "status": ERROR,
+        "steps": -1,
+        "moves": None,
+        "nodes_expanded": None,
+        "states_seen": None,
+        "states_pruned": None,
+        "peak_memory": None,
+        "elapsed_time": None,
+        "complete": False,
+        "optimal": False,
+        "lower_bound": None,
+        "error": f"{type(error).__name__}: {error}"
+    }
+
+
+_REPORT_COLUMNS = ("file", "name", "status", "steps", "complete", "optimal", "lower_bound", "nodes_expanded", "states_seen",
+                   "states_pruned", "peak_memory", "elapsed_time", "error", "moves")
+
+
+def write_report(results: typing.List[dict], filepath):
+    """Writes solver results to a .json or .csv file (based on its extension)."""
+    if filepath.endswith(".csv"):
+        with open(filepath, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=_REPORT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            for r in results:
+                row = dict(r)
+                if row["moves"] is not None:
+                    row["moves"] = replays.encode(row["moves"])
+                writer.writerow(row)
+    else:
+        with open(filepath, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(f"INFO: wrote solver report to {filepath}")
+
+
+def _level_files(names_or_paths) -> typing.List[str]:
+    base_path = utils.asset_path("assets/levels")
+    all_files = [os.path.join(base_path, fname) for fname in sorted(os.listdir(base_path)) if fname.endswith(".json")]
+    if len(names_or_paths) == 0:
+        return all_files
+
+    res = []
+    for arg in names_or_paths:
+        if os.path.isfile(arg):
+            res.append(arg)
+        else:
+            # level names (as they appear in the game) are matched against the files' contents
+            for path in all_files:
+                with open(path, 'r') as f:
+                    if json.load(f)[level.NAME_TAG] == arg:
+                        res.append(path)
+                        break
+            else:
+                raise ValueError(f"unrecognized level: {arg}")
+    return res
+
+
+def _main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m src.solver",
+                                     description="Finds (optimal, where possible) solutions to levels in parallel.")
+    parser.add_argument("levels", nargs="*", help="level names or json files (default: all of assets/levels)")
+    parser.add_argument("-o", "--out", help="where to write the report (.json or .csv)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-t", "--time-limit", type=float, default=None, help="seconds to spend on each level")
+    parser.add_argument("-n", "--max-states", type=int, default=None,
+                        help="states to keep in memory while searching each level")
+    parser.add_argument("--max-expanded", type=int, default=None, help="states to expand in each level")
+    parser.add_argument("--mode", choices=MODES, default="auto",
+                        help="search strategy (auto: bfs, or beam if that runs out of --bfs-states, in which case the "
+                             "solution might not be the shortest, and the exit code is 1)")
+    parser.add_argument("--heuristic", choices=sorted(heuristics.HEURISTICS), default=None,
+                        help="heuristic for the astar, ida, beam and auto modes")
+    parser.add_argument("--weight", type=float, default=1.0, help="heuristic weight for the astar mode")
+    parser.add_argument("--beam-width", type=int, default=2000,
+                        help="layers (of states that only differ by the player's position) per depth for the beam "
+                             "and auto modes")
+    parser.add_argument("--bfs-states", type=int, default=1000000,
+                        help="states the auto mode's bfs can look at before it falls back to beam search")
+    parser.add_argument("-m", "--measure-memory", action="store_true", help="track peak memory (slower)")
+    parser.add_argument("--no-prune", action="store_true", help="don't skip deadlocked states")
+    parser.add_argument("-c", "--cache", default=None,
+                        help="file of known solutions to skip levels that haven't changed, and to save new results "
+                             f"to (default: only read the shipped ones, {solutions.CACHE_PATH})")
+    parser.add_argument("--no-cache", action="store_true", help="solve every level, even ones in the cache")
+    opts = parser.parse_args(args)
+
+    if opts.no_cache:
+        cache = None
+    elif opts.cache is None:
+        cache = solutions.SolutionCache(utils.asset_path(solutions.CACHE_PATH), read_only=True)
+    else:
+        cache = solutions.SolutionCache(opts.cache)
+    results = solve_files(_level_files(opts.levels), workers=opts.workers, max_states=opts.max_states,
+                          time_limit=opts.time_limit, measure_memory=opts.measure_memory,
+                          prune_deadlocks=not opts.no_prune, cache=cache, mode=opts.mode,
+                          heuristic=opts.heuristic, weight=opts.weight, beam_width=opts.beam_width,
+                          bfs_states=opts.bfs_states, max_expanded=opts.max_expanded)
+    if opts.out is not None:
+        write_report(results, opts.out)
+    return results
+
+
+def _exit_code(results: typing.List[dict]) -> int:
+    """returns: 0 if every level's shortest solution was found (or it was proven to have none), or 1 if not."""
+    unanswered = [r["name"] for r in results if r["status"] not in (OPTIMAL, UNSOLVABLE)]
+    if len(unanswered) > 0:
+        print(f"WARN: {len(unanswered)} level(s) weren't solved optimally: {', '.join(unanswered)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_exit_code(_main()))
@@ -0,0 +1,122 @@
+import argparse
+import hashlib
+import json
+import os
+import typing
+
+import pygame
+
+import configs
+import src.sprites as sprites
+import src.utils as utils
+
+
+# Bump this whenever the way shapes are made changes (e.g. their palette), so that old atlases aren't used anymore.
+ATLAS_VERSION = 1
+
+# the baked shapes (see sprites.get_shape), and where each one is in the image
+ATLAS_PATH = "assets/sprite_atlas.png"
+INDEX_PATH = "assets/sprite_atlas.json"
+
+_ATLAS_WIDTH = 512
+
+
+def source_hash() -> str:
+    """returns: a hash of the sprite sheet's file, which the atlas was made from."""
+    with open(utils.asset_path(sprites.SHEET_PATH), 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def bake(cell_size=configs.CELL_SIZE, atlas_path=ATLAS_PATH, index_path=INDEX_PATH):
+    """Makes every shape that the game uses at the given cell size, and saves them into one image (with an index
+    of where they are). The paths are resolved the same way `load` resolves them."""
+    atlas_path = utils.asset_path(atlas_path)
+    index_path = utils.asset_path(index_path)
+    keys = sprites.get_shape_keys(cell_size)
+    shapes = [sprites.get_shape(*key) for key in keys]
+
+    # the shapes are packed into rows, tallest first
+    order = sorted(range(len(keys)), key=lambda i: -shapes[i].get_height())
+    rects = [None] * len(keys)
+    x, y, row_height = 0, 0, 0
+    for i in order:
+        w, h = shapes[i].get_size()
+        if x + w > _ATLAS_WIDTH:
+            x, y, row_height = 0, y + row_height, 0
+        rects[i] = (x, y, w, h)
+        x += w
+        row_height = max(row_height, h)
+
+    atlas = pygame.Surface((_ATLAS_WIDTH, y + row_height), 0, 8)
+    atlas.set_palette(shapes[0].get_palette())
+    atlas.fill(shapes[0].get_colorkey())
+    for shape, rect in zip(shapes, rects):
+        atlas.blit(shape, rect[:2])
+
+    index = {
+        "version": ATLAS_VERSION,
+        "source_hash": source_hash(),
+        "cell_size": cell_size,
+        "shapes": [list(key) + [list(rect)] for key, rect in zip(keys, rects)]
+    }
+
+    # written to temp files first, so that an interrupted save can't leave a broken atlas behind
+    temp_path = atlas_path + ".tmp.png"
+    pygame.image.save(atlas, temp_path)
+    os.replace(temp_path, atlas_path)
+    temp_path = index_path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(temp_path, index_path)
+    print(f"INFO: baked {len(keys)} sprite shape(s) into {atlas_path}")
+
+
+def load(cell_size=configs.CELL_SIZE, atlas_path=ATLAS_PATH, index_path=INDEX_PATH) -> bool:
+    """Adds the atlas's shapes to the sprite cache, if it's up to date (i.e. it was baked from the current sprite
+    sheet, for the given cell size).
+    returns: whether it was.
+    """
+    atlas_path = utils.asset_path(atlas_path)
+    index_path = utils.asset_path(index_path)
+    if not os.path.exists(index_path):
+        print(f"INFO: no sprite atlas found at {index_path}")
+        return False
+    try:
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        if index.get("version") != ATLAS_VERSION or index.get("cell_size") != cell_size:
+            return False
+        elif index.get("source_hash") != source_hash():
+            print(f"WARN: {atlas_path} is out of date (the sprite sheet has changed), run "
+                  f"`python -m src.spriteatlas` to rebake it")
+            return False
+        atlas = pygame.image.load(atlas_path)  # the only image that has to be decoded
+        if atlas.get_bitsize() != 8:
+            raise ValueError(f"atlas isn't palettized: {atlas_path}")
+
+        shapes: typing.Dict[tuple, pygame.Surface] = {}
+        for ent_id, size, flipped, frame, rect in index["shapes"]:
+            shapes[(ent_id, size, flipped, frame)] = atlas.subsurface(rect).copy()
+    except (OSError, ValueError, KeyError, TypeError, pygame.error):
+        print(f"ERROR: failed to load sprite atlas: {atlas_path}")
+        return False
+
+    sprites.add_shapes(shapes)
+    return True
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m src.spriteatlas",
+                                     description="Bakes the sprite atlas (which is loaded instead of the sprite "
+                                                 "sheet, so that the game starts faster).")
+    parser.add_argument("-c", "--cell-size", type=int, default=configs.CELL_SIZE, help="size of levels' cells")
+    opts = parser.parse_args(args)
+
+    pygame.display.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    sprites.load()
+    bake(cell_size=opts.cell_size)
+
+
+if __name__ == "__main__":
+    main()
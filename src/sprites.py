@@ -1,11 +1,109 @@
+import collections
+import time
+import typing
+
 import pygame
 
+import configs
 import src.utils as utils
 import src.colors as colors
 
-SHEET = None
+
+class SpriteCache:
+    """A cache of surfaces, which drops the least recently used ones once they take up more than max_bytes.
+
+    Pinned keys are never dropped (and their surfaces don't count towards max_bytes).
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: typing.OrderedDict[tuple, pygame.Surface] = collections.OrderedDict()  # oldest first
+        self._pinned: typing.Set[tuple] = set()
+        self._num_bytes = 0
+        self._pinned_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def num_bytes(self) -> int:
+        return self._num_bytes
+
+    def get(self, key) -> typing.Optional[pygame.Surface]:
+        res = self._entries.get(key)
+        if res is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return res
+
+    def put(self, key, surf: pygame.Surface):
+        self._remove(key)
+        self._entries[key] = surf
+        self._num_bytes += _surface_bytes(surf)
+        if key in self._pinned:
+            self._pinned_bytes += _surface_bytes(surf)
+        self._evict()
+
+    def items(self) -> typing.Iterable[typing.Tuple[tuple, pygame.Surface]]:
+        return self._entries.items()
+
+    def pin(self, key):
+        if key not in self._pinned:
+            self._pinned.add(key)
+            if key in self._entries:
+                self._pinned_bytes += _surface_bytes(self._entries[key])
+
+    def unpin(self, key):
+        if key in self._pinned:
+            self._pinned.remove(key)
+            if key in self._entries:
+                self._pinned_bytes -= _surface_bytes(self._entries[key])
+                self._evict()
+
+    def clear(self):
+        """Drops every surface (but pinned keys stay pinned)."""
+        self._entries.clear()
+        self._num_bytes = 0
+        self._pinned_bytes = 0
+
+    def _remove(self, key):
+        surf = self._entries.pop(key, None)
+        if surf is not None:
+            self._num_bytes -= _surface_bytes(surf)
+            if key in self._pinned:
+                self._pinned_bytes -= _surface_bytes(surf)
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self._num_bytes - self._pinned_bytes > self.max_bytes:
+            key, surf = self._entries.popitem(last=False)
+            if key in self._pinned:
+                self._entries[key] = surf  # it can't be dropped, so it goes to the back of the line instead
+            else:
+                self._num_bytes -= _surface_bytes(surf)
+                self.evictions += 1
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size={len(self)}, bytes={self._num_bytes}, " \
+               f"unpinned_bytes={self._num_bytes - self._pinned_bytes}/{self.max_bytes}, " \
+               f"pinned={len(self._pinned)}, hits={self.hits}, misses={self.misses}, evictions={self.evictions})"
+
+
+def _surface_bytes(surf: pygame.Surface) -> int:
+    return surf.get_pitch() * surf.get_height()
+
+
+SHEET = None  # loaded lazily (see load)
 BASE_SPRITES = {}
-_CACHE = {}
+_SHAPES = SpriteCache(max_bytes=configs.SPRITE_CACHE_MAX_BYTES // 4)  # (ent_id, size, flipped, frame) -> 8-bit surface
+_CACHE = SpriteCache(max_bytes=configs.SPRITE_CACHE_MAX_BYTES)  # get_sprite's args -> its shape, tinted its color
+_CACHE_GENERATION = 0  # incremented whenever the cache is cleared or recolored
 
 
 class EntityID:
@@ -40,10 +138,23 @@ class EntityID:
         return (EntityID.WALL, EntityID.BOX)
 
 
+# sprites are palettized, and the art only uses black and white (and fully transparent pixels), so a sprite can be
+# recolored by changing the color of its "tint" entry (the white one) without touching its pixels.
+_TRANSPARENT_IDX = 0
+_TINT_IDX = 2
+_SHAPE_PALETTE = [(255, 0, 255), (0, 0, 0), (255, 255, 255)]  # transparent, black, tint
+
+
+SHEET_PATH = "assets/assets.png"
+_FRAME_RECTS = {}  # ent_id -> the (x, y, w, h) of each frame of its animation in the sheet
+
+
 def load():
-    global SHEET, BASE_SPRITES
-    img_path = utils.asset_path("assets/assets.png")
-    SHEET = pygame.image.load(img_path).convert_alpha()
+    """Finds where each sprite is in the sheet. The sheet itself isn't loaded until a sprite that isn't in the
+    baked atlas (see src.spriteatlas) is needed."""
+    global SHEET
+    SHEET = None
+    BASE_SPRITES.clear()
 
     def imgs(xs, ys, w=16, h=16):
         ys = (ys,) if isinstance(ys, int) else ys
@@ -51,68 +162,160 @@ def load():
         res = []
         for y in ys:
             for x in xs:
-                res.append(SHEET.subsurface(x, y, w, h))
+                res.append((x, y, w, h))
         return res
 
-    BASE_SPRITES[EntityID.PLAYER] = imgs((0, 16), 0)
-    BASE_SPRITES[EntityID.H_WALKER] = imgs((0, 16), 16)
-    BASE_SPRITES[EntityID.V_WALKER] = imgs((0, 16, 32, 48), 32)
-    BASE_SPRITES[EntityID.NO_WALKER] = imgs((16, 32), 48)
-    BASE_SPRITES[EntityID.WALL] = imgs(32, 0)
-    BASE_SPRITES[EntityID.SNEK] = imgs((32, 48), 16)
-    BASE_SPRITES[EntityID.POTION] = imgs(0, 48)
-    BASE_SPRITES[EntityID.BOX] = imgs(48, 0)
-    BASE_SPRITES[EntityID.EXPLOSION] = imgs((64, 80, 96, 112), (0, 16, 32))
-    BASE_SPRITES[EntityID.BIG_PLAYER] = imgs(0, 64, w=64, h=64)
-    BASE_SPRITES[EntityID.BIG_V_WALKER] = imgs(64, 64, w=64, h=64)
+    _FRAME_RECTS[EntityID.PLAYER] = imgs((0, 16), 0)
+    _FRAME_RECTS[EntityID.H_WALKER] = imgs((0, 16), 16)
+    _FRAME_RECTS[EntityID.V_WALKER] = imgs((0, 16, 32, 48), 32)
+    _FRAME_RECTS[EntityID.NO_WALKER] = imgs((16, 32), 48)
+    _FRAME_RECTS[EntityID.WALL] = imgs(32, 0)
+    _FRAME_RECTS[EntityID.SNEK] = imgs((32, 48), 16)
+    _FRAME_RECTS[EntityID.POTION] = imgs(0, 48)
+    _FRAME_RECTS[EntityID.BOX] = imgs(48, 0)
+    _FRAME_RECTS[EntityID.EXPLOSION] = imgs((64, 80, 96, 112), (0, 16, 32))
+    _FRAME_RECTS[EntityID.BIG_PLAYER] = imgs(0, 64, w=64, h=64)
+    _FRAME_RECTS[EntityID.BIG_V_WALKER] = imgs(64, 64, w=64, h=64)
+
+
+def _load_sheet():
+    global SHEET
+    img_path = utils.asset_path(SHEET_PATH)
+    SHEET = _to_shape(pygame.image.load(img_path).convert_alpha())
+    for ent_id, rects in _FRAME_RECTS.items():
+        BASE_SPRITES[ent_id] = [SHEET.subsurface(rect) for rect in rects]
+    print(f"INFO: loaded sprite sheet {img_path}")
+
+
+def get_num_frames(ent_id) -> int:
+    return len(_FRAME_RECTS[ent_id])
+
+
+def is_flippable(ent_id) -> bool:
+    """returns: whether the entity's sprite is mirrored when it faces left."""
+    return ent_id in (EntityID.PLAYER, EntityID.H_WALKER, EntityID.V_WALKER, EntityID.SNEK)
+
+
+def get_shape_keys(cell_size) -> typing.List[tuple]:
+    """returns: the keys (see get_shape) of every shape that can be drawn in a level with the given cell size, or
+    on the main menu."""
+    res = []
+    for ent_id in _FRAME_RECTS:
+        size = 64 * 3 if ent_id in (EntityID.BIG_PLAYER, EntityID.BIG_V_WALKER) else cell_size
+        for flipped in ((False, True) if is_flippable(ent_id) else (False,)):
+            res.extend((ent_id, size, flipped, frame) for frame in range(get_num_frames(ent_id)))
+    return res
+
+
+def add_shapes(shapes: typing.Dict[tuple, pygame.Surface]):
+    """Adds ready-made shapes (see get_shape) to the cache, where they're kept for good."""
+    for key, shape in shapes.items():
+        shape.set_colorkey(_TRANSPARENT_IDX)
+        _SHAPES.pin(key)
+        _SHAPES.put(key, shape)
 
 
 def clear_cache():
+    global _CACHE_GENERATION
+    _SHAPES.clear()
     _CACHE.clear()
+    _CACHE_GENERATION += 1
+
+
+def refresh_colors():
+    """Updates the cached sprites to match the current colors (after colors.load), without remaking them."""
+    global _CACHE_GENERATION
+    for key, sprite in _CACHE.items():
+        sprite.set_palette_at(_TINT_IDX, colors.get_color(key[2]))
+    _CACHE_GENERATION += 1
+
+
+def get_cache() -> SpriteCache:
+    """returns: the cache of sprites returned by get_sprite (e.g. to look at its stats)."""
+    return _CACHE
 
 
-def _recolor_slow(surf: pygame.Surface, start_color, end_color):
-    # slow operation, make sure to cache the result
-    res = surf.copy()
-    for x in range(res.get_width()):
-        for y in range(res.get_height()):
-            if res.get_at((x, y)) == start_color:
-                res.set_at((x, y), end_color)
+def pin(keys: typing.Iterable[tuple]):
+    """Keeps the sprites with the given keys (see SpriteBaker) from ever being dropped from the cache."""
+    for key in keys:
+        _CACHE.pin(_normalize_key(key))
+
+
+def unpin(keys: typing.Iterable[tuple]):
+    for key in keys:
+        _CACHE.unpin(_normalize_key(key))
+
+
+def get_cache_generation() -> int:
+    """returns: a number that changes whenever previously returned sprites become outdated."""
+    return _CACHE_GENERATION
+
+
+def _to_shape(surf: pygame.Surface) -> pygame.Surface:
+    """returns: an 8-bit copy of a (black and white) image, with transparent pixels as its colorkey.
+    This is slow-ish no matter how small the image is, so it's only done to the whole sheet."""
+    # blits into an 8-bit surface ignore alpha, so the transparent pixels are filled in with their color first
+    flat = pygame.Surface(surf.get_size())
+    flat.fill(_SHAPE_PALETTE[_TRANSPARENT_IDX])
+    flat.blit(surf, (0, 0))
+
+    res = pygame.Surface(surf.get_size(), 0, 8)
+    res.set_palette(_SHAPE_PALETTE)
+    res.blit(flat, (0, 0))
+    res.set_colorkey(_TRANSPARENT_IDX)
     return res
 
 
-def _recolor_fast(surf: pygame.Surface, end_color):
-    res = surf.copy()
-    res.fill(end_color)
-    res.blit(surf, (0, 0), surf.get_rect(), special_flags=pygame.BLEND_MULT)
+def get_shape(ent_id, size, flipped, frame) -> pygame.Surface:
+    """returns: an 8-bit image of a frame of the entity's animation (in the palette above), scaled to size x size
+    and mirrored horizontally if flipped."""
+    key = ent_id, size, flipped, frame
+    res = _SHAPES.get(key)
+    if res is None:
+        if SHEET is None:
+            _load_sheet()
+        res = BASE_SPRITES[ent_id][frame]
+        if flipped:
+            res = pygame.transform.flip(res, True, False)
+        if res.get_size() != (size, size):
+            res = pygame.transform.scale(res, (size, size))
+        elif not flipped:
+            res = res.copy()  # so it doesn't keep the whole sheet around
+        res.set_colorkey(_TRANSPARENT_IDX)
+        _SHAPES.put(key, res)
     return res
 
 
-def _get_sprite(key, nocache=False):
-    ent_id, size, color_id, direction, anim_idx = key
-    base_sprites = BASE_SPRITES[ent_id]
-    if len(base_sprites) == 4 and ent_id == EntityID.V_WALKER:
-        base_sprites = base_sprites[0:2] if direction[1] >= 0 else base_sprites[2:4]
+def _get_frames(ent_id, direction) -> typing.Tuple[int, int]:
+    """returns: (index of the first frame, number of frames) of the entity's animation, when facing direction."""
+    n_frames = len(_FRAME_RECTS[ent_id])
+    if n_frames == 4 and ent_id == EntityID.V_WALKER:
+        return (0 if direction[1] >= 0 else 2), 2
+    return 0, n_frames
 
-    anim_idx = anim_idx % len(base_sprites)
-    key = ent_id, size, color_id, direction, anim_idx
 
-    if key not in _CACHE:
-        sprite: pygame.Surface = base_sprites[anim_idx]
-        if direction[0] < 0 and ent_id in (EntityID.PLAYER, EntityID.H_WALKER,
-                                           EntityID.V_WALKER, EntityID.SNEK):
-            sprite = pygame.transform.flip(sprite, True, False)
+def _normalize_key(key):
+    ent_id, size, color_id, direction, anim_idx = key
+    return ent_id, size, color_id, direction, anim_idx % _get_frames(ent_id, direction)[1]
+
 
-        sprite = _recolor_slow(sprite, (255, 255, 255), colors.get_color(color_id))
+def _get_sprite(key, nocache=False):
+    ent_id, size, color_id, direction, anim_idx = key
+    first_frame, n_frames = _get_frames(ent_id, direction)
+    anim_idx = anim_idx % n_frames
+    key = ent_id, size, color_id, direction, anim_idx
 
-        if sprite.get_size() != size:
-            sprite = pygame.transform.scale(sprite, (size, size))
+    sprite = _CACHE.get(key)
+    if sprite is None:
+        flipped = direction[0] < 0 and is_flippable(ent_id)
+        sprite = get_shape(ent_id, size, flipped, first_frame + anim_idx).copy()
+        sprite.set_palette_at(_TINT_IDX, colors.get_color(color_id))
 
         if nocache:
             return sprite
-        _CACHE[key] = sprite
+        _CACHE.put(key, sprite)
 
-    return _CACHE[key]
+    return sprite
 
 
 def get_sprite(ent_id, size, color_id=0, direction=(0, 1), anim_idx=0):
@@ -121,6 +324,54 @@ def get_sprite(ent_id, size, color_id=0, direction=(0, 1), anim_idx=0):
 
 
 def get_animated_sprite(ent_id, size, prog, color_id=0, direction=(0, 1)):
-    base_sprites = BASE_SPRITES[ent_id]
-    idx = max(0, min(len(base_sprites), int(prog * (len(base_sprites)))))
-    return get_sprite(ent_id, size, color_id=color_id, direction=direction, anim_idx=idx)
\ No newline at end of file
+    n_frames = get_num_frames(ent_id)
+    idx = max(0, min(n_frames, int(prog * n_frames)))
+    return get_sprite(ent_id, size, color_id=color_id, direction=direction, anim_idx=idx)
+
+
+class SpriteBaker:
+    """Puts sprites into the cache ahead of time, a few at a time (so that they don't have to be made in the
+    middle of drawing a frame, and so that making all of them doesn't stall the game while it's starting up).
+
+    Keys are the same as get_sprite's arguments: (ent_id, size, color_id, direction, anim_idx).
+    """
+
+    def __init__(self, keys: typing.Iterable[tuple]):
+        self._keys = list(dict.fromkeys(keys))  # without duplicates, in order
+        self._idx = 0
+        self._generation = _CACHE_GENERATION
+        self._elapsed_time = 0.0
+
+    def update(self, time_budget) -> bool:
+        """Bakes sprites for up to time_budget seconds (but always at least one, if any are left).
+        returns: whether every sprite has been baked.
+        """
+        if self._generation != _CACHE_GENERATION:
+            # the cache was cleared, so everything has to be baked again
+            self._generation = _CACHE_GENERATION
+            self._idx = 0
+        start_time = time.perf_counter()
+        end_time = start_time + time_budget
+        while self._idx < len(self._keys):
+            _get_sprite(self._keys[self._idx])
+            self._idx += 1
+            if time.perf_counter() >= end_time:
+                break
+        self._elapsed_time += time.perf_counter() - start_time
+        return self.is_done()
+
+    def is_done(self) -> bool:
+        return self._idx >= len(self._keys) and self._generation == _CACHE_GENERATION
+
+    def get_progress(self) -> float:
+        """returns: the fraction of the sprites that have been baked, from 0 to 1."""
+        if self._generation != _CACHE_GENERATION:
+            return 0.0
+        return 1.0 if len(self._keys) == 0 else self._idx / len(self._keys)
+
+    def get_num_sprites(self) -> int:
+        return len(self._keys)
+
+    def get_elapsed_time(self) -> float:
+        """returns: the total number of seconds spent baking."""
+        return self._elapsed_time
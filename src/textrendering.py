@@ -1,3 +1,4 @@
+import collections
 import pygame
 import typing
 import src.utils as utils
@@ -5,8 +6,15 @@ import src.colors as colors
 
 
 _CACHED_FONTS = {}  # (name, size) -> Font
+_GLYPH_ATLASES = {}  # (name, size, color, bg_color) -> GlyphAtlas
 _SIZE_MAPPING = {"S": 16, "M": 24, "L": 32, "H": 64}
 
+# how many laid-out lines of text each GlyphAtlas remembers
+LAYOUT_CACHE_SIZE = 256
+
+# how many times a line of text is drawn glyph by glyph before it's rendered whole
+_DRAWS_BEFORE_RENDERING_WHOLE = 3
+
 
 def load_font(name, size) -> pygame.font.Font:
     if isinstance(size, str):
@@ -18,6 +26,107 @@ def load_font(name, size) -> pygame.font.Font:
     return _CACHED_FONTS[key]
 
 
+def get_glyph_atlas(name, size, color, bg_color=None) -> 'GlyphAtlas':
+    if isinstance(size, str):
+        size = _SIZE_MAPPING[size.upper()]
+    color = tuple(color)
+    bg_color = tuple(bg_color) if bg_color is not None else None
+    key = name, size, color, bg_color
+    if key not in _GLYPH_ATLASES:
+        _GLYPH_ATLASES[key] = GlyphAtlas(load_font(name, size), color, bg_color)
+    return _GLYPH_ATLASES[key]
+
+
+class TextLayout:
+    """A line of text that's ready to be drawn: the surfaces to blit, and where (relative to the line's left)."""
+
+    __slots__ = ('text', 'width', 'height', 'blits', 'num_draws')
+
+    def __init__(self, text, width, height, blits: typing.List[typing.Tuple[pygame.Surface, int]]):
+        self.text = text
+        self.width = width
+        self.height = height
+        self.blits = blits  # (surface, x offset)
+        self.num_draws = 0
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+
+class GlyphAtlas:
+    """The glyphs of a font in one color, which are rendered once and shared by every TextRenderer that uses them.
+
+    New lines of text are drawn by blitting their glyphs side by side (at the same spots Font.render would put
+    them), so text that keeps changing (like a step counter) doesn't need a new surface each time it does. Lines
+    that are drawn over and over are rendered whole instead, since one big blit is faster than many small ones.
+    So are lines with glyphs that reach outside their own cells (like "_"). The layouts of the most recently used
+    lines are cached.
+    """
+
+    def __init__(self, font: pygame.font.Font, color, bg_color=None):
+        self.font = font
+        self.color = color
+        self.bg_color = bg_color
+
+        # char -> (glyph, or None if it's blank, advance), or None if it can't be drawn alone
+        self._glyphs: typing.Dict[str, typing.Optional[typing.Tuple[pygame.Surface, int]]] = {}
+        self._layouts: typing.OrderedDict[str, TextLayout] = collections.OrderedDict()
+
+    def _get_glyph(self, char) -> typing.Optional[typing.Tuple[pygame.Surface, int]]:
+        if char not in self._glyphs:
+            metrics = self.font.metrics(char)[0]
+            if metrics is None or metrics[0] < 0 or metrics[1] > metrics[4]:
+                self._glyphs[char] = None  # it's missing, or it overlaps its neighbors
+            else:
+                glyph = self.font.render(char, False, self.color, self.bg_color)
+                if self.bg_color is None and glyph.get_bounding_rect().width == 0:
+                    glyph = None  # there's nothing to draw (e.g. it's a space)
+                self._glyphs[char] = glyph, metrics[4]
+        return self._glyphs[char]
+
+    def _render_whole(self, layout: TextLayout):
+        layout.blits = [(self.font.render(layout.text, False, self.color, self.bg_color), 0)]
+
+    def layout(self, line: str) -> TextLayout:
+        res = self._layouts.get(line)
+        if res is not None:
+            self._layouts.move_to_end(line)
+            return res
+
+        width, height = self.font.size(line)
+        res = TextLayout(line, width, height, [])
+        x = 0
+        can_draw_glyphs = True
+        for char in line:
+            glyph = self._get_glyph(char)
+            if glyph is None:
+                can_draw_glyphs = False
+                break
+            elif glyph[0] is not None:
+                res.blits.append((glyph[0], x))
+            x += glyph[1]
+        if not can_draw_glyphs or x != width:
+            self._render_whole(res)  # it has a glyph that can't be drawn alone (or the font kerns it)
+
+        self._layouts[line] = res
+        while len(self._layouts) > LAYOUT_CACHE_SIZE:
+            self._layouts.popitem(last=False)
+        return res
+
+    def draw(self, dest_surf: pygame.Surface, layout: TextLayout, xy):
+        layout.num_draws += 1
+        if layout.num_draws == _DRAWS_BEFORE_RENDERING_WHOLE and len(layout.blits) > 1:
+            self._render_whole(layout)
+        x, y = xy
+        if len(layout.blits) == 1:
+            dest_surf.blit(layout.blits[0][0], (x + layout.blits[0][1], y))
+        else:
+            dest_surf.blits([(glyph, (x + dx, y)) for glyph, dx in layout.blits], doreturn=False)
+
+
 class TextRenderer:
 
     def __init__(self, text: str, size: typing.Union[int, str], color=None, bg_color=None,
@@ -31,27 +140,25 @@ class TextRenderer:
         self._alignment = alignment
 
         # cached stuff
-        self._text_font = load_font(font_name, size)
-        self._cached_text_surfaces = None
+        self._glyph_atlas = None
+        self._cached_text_lines: typing.Optional[typing.List[TextLayout]] = None
 
         self._last_drawn_at_rect = None
 
     def _refresh(self, force=False):
         if force:
-            self._cached_text_surfaces = None
-            self._text_font = None
+            self._cached_text_lines = None
+            self._glyph_atlas = None
 
-        if self._cached_text_surfaces is None or self._text_font is None:
-            self._text_font = load_font(self._text_font_name, self._text_size)
-            self._cached_text_surfaces = []
-            for line in self._text.split("\n"):
-                surf = self._text_font.render(line, False, self._text_color, self._bg_color)
-                self._cached_text_surfaces.append(surf)
+        if self._cached_text_lines is None or self._glyph_atlas is None:
+            self._glyph_atlas = get_glyph_atlas(self._text_font_name, self._text_size,
+                                                self._text_color, self._bg_color)
+            self._cached_text_lines = [self._glyph_atlas.layout(line) for line in self._text.split("\n")]
 
     def get_size(self):
         self._refresh()
         w, h = 0, 0
-        for line_img in self._cached_text_surfaces:
+        for line_img in self._cached_text_lines:
             w = max(w, line_img.get_width())
             if h > 0:
                 h += self._text_y_kerning
@@ -65,14 +172,14 @@ class TextRenderer:
         self._refresh()
         x, y = xy
         w, h = self.get_size()
-        for line_img in self._cached_text_surfaces:
+        for line_img in self._cached_text_lines:
             if self._alignment == -1:  # left aligned
                 x_to_use = x
             elif self._alignment == 1:  # right aligned
                 x_to_use = x + w - line_img.get_width()
             else:  # centered
                 x_to_use = int(x + w / 2 - line_img.get_width() / 2)
-            dest_surf.blit(line_img, (x_to_use, y))
+            self._glyph_atlas.draw(dest_surf, line_img, (x_to_use, y))
             y += line_img.get_height() + self._text_y_kerning
 
         self._last_drawn_at_rect = (x, xy[1], w, h)
@@ -89,7 +196,7 @@ class TextRenderer:
     def set_text(self, new_text):
         if new_text != self._text:
             self._text = new_text
-            self._cached_text_surfaces = None
+            self._cached_text_lines = None
 
     def get_text(self):
         return self._text
@@ -98,11 +205,11 @@ class TextRenderer:
         if self._text_color != color or (bg_color != "nochange" and bg_color != self._bg_color):
             self._text_color = color
             self._bg_color = self._bg_color if bg_color == "nochange" else bg_color
-            self._cached_text_surfaces = None
-            self._text_font = None
+            self._cached_text_lines = None
+            self._glyph_atlas = None
 
     def set_size(self, size):
         if self._text_size != size:
             self._text_size = size
-            self._cached_text_surfaces = None
-            self._text_font = None
\ No newline at end of file
+            self._cached_text_lines = None
+            self._glyph_atlas = None
\ No newline at end of file
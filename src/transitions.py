@@ -0,0 +1,62 @@
+import collections
+import copy
+import typing
+
+import src.level as level
+
+
+def _art_directions(state: level.State) -> typing.Dict[int, typing.Tuple[int, int]]:
+    """returns: uid -> art_direction of each of the state's (non-static) entities."""
+    return {e.uid: e.art_direction for ents in state.level.values() for e in ents}
+
+
+class TransitionCache:
+    """Remembers the results of State.get_next, so that steps that are taken again (e.g. when the player undoes a
+    move and then makes it again) don't have to be simulated again.
+
+    Entries are keyed on the state's hash, step, and the input direction, and the least recently used ones are
+    dropped once there are more than max_size of them. A hit only counts if the state's entities (and their uids,
+    which the renderer uses to animate the step) are in the same places, and facing the same way, as the cached
+    one's (the hash leaves out which way the sprites face, but the step carries it over).
+
+    On a hit, a shallow copy of the cached successor is returned (so that it can have its own prev), which shares
+    its entities with the cached one, so states returned by the cache must not be modified.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        # (state hash, step, direction) -> (the state's entity positions, which way they face, its terrain, the
+        # state after it)
+        self._entries: typing.OrderedDict[tuple, tuple] = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_next(self, state: level.State, player_dir) -> level.State:
+        """returns: the same thing as state.get_next(player_dir)."""
+        key = (hash(state), state.step, tuple(player_dir))
+        entry = self._entries.get(key)
+        if (entry is not None and entry[2] is state.terrain and entry[0] == state._positions
+                and entry[1] == _art_directions(state)):
+            self.hits += 1
+            self._entries.move_to_end(key)
+            res = copy.copy(entry[3])
+            res.prev = state
+            return res
+
+        self.misses += 1
+        res = state.get_next(player_dir)
+        self._entries[key] = (dict(state._positions), _art_directions(state), state.terrain, copy.copy(res))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return res
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size={len(self)}/{self.max_size}, hits={self.hits}, misses={self.misses})"